@@ -1,3 +1,129 @@
 NUMBER_OF_PRODUCTS = 5
 NUMBER_REVIEWS = 5
 SEARCH_KEYWORD = "running shoes"
+
+REQUEST_TIME_BUDGET = 15 * 60
+
+# browsers started up front per site
+DRIVER_POOL_MIN_SIZES = {
+    "amazon": 1,
+    "default": 0,
+}
+DRIVER_POOL_MAX_SIZE = 4
+# browsers live across every site, idle browsers of a site being quit to start one for another
+DRIVER_POOL_TOTAL_SIZE = 4
+DRIVER_MAX_PAGES = 200
+DRIVER_ACQUIRE_TIMEOUT = 300
+
+JOB_WORKERS = 4
+JOB_HISTORY_SIZE = 500
+
+BATCH_WORKERS = 8
+# tasks running at once per site; ebay products are fetched over http, borrowing a driver only for feedback. The
+# other sites share the DRIVER_POOL_TOTAL_SIZE browsers, a task left waiting past DRIVER_ACQUIRE_TIMEOUT fails alone
+BATCH_SITE_CONCURRENCY = {
+    "ebay": 8,
+    "default": DRIVER_POOL_TOTAL_SIZE,
+}
+BATCH_HISTORY_SIZE = 100
+
+FANOUT_WORKERS = 6
+FANOUT_DEADLINES = {
+    "amazon": 180,
+    "ebay": 90,
+    "walmart": 120,
+    "default": 120,
+}
+
+HTTP_POOL_HOSTS = 10
+HTTP_PER_HOST_CONNECTIONS = 8
+HTTP_CONCURRENCY = 16
+HTTP_TIMEOUT = 30
+
+# requests per second and concurrent requests per site, adapted between the bounds by the rate limiter
+RATE_LIMITS = {
+    "amazon": {"rate": 1.0, "min_rate": 0.1, "max_rate": 8.0, "concurrency": 2, "max_concurrency": 8},
+    "ebay": {"rate": 2.0, "min_rate": 0.2, "max_rate": 20.0, "concurrency": 4, "max_concurrency": 16},
+    "walmart": {"rate": 1.0, "min_rate": 0.1, "max_rate": 8.0, "concurrency": 2, "max_concurrency": 8},
+    "default": {"rate": 2.0, "min_rate": 0.2, "max_rate": 20.0, "concurrency": 4, "max_concurrency": 16},
+}
+RATE_LIMIT_INCREASE = 0.1
+RATE_LIMIT_DECREASE = 0.5
+RATE_LIMIT_COOLDOWN = 10
+
+# browser reloads of a blocked page on a fresh driver, waiting BLOCK_RETRY_BACKOFF * 2 ** attempt seconds between them
+BLOCK_RETRIES = 2
+BLOCK_RETRY_BACKOFF = 2
+# consecutive block pages opening the circuit of a site, closed again after a backoff doubling on every reopening
+CIRCUIT_BREAKER_THRESHOLD = 3
+CIRCUIT_BREAKER_BACKOFF = 5
+CIRCUIT_BREAKER_MAX_BACKOFF = 300
+
+EBAY_RESULTS_PER_PAGE = 60
+
+AMAZON_CONCURRENCY = 4
+AMAZON_MAX_LISTING_PAGES = 20
+
+AMAZON_HTTP_FIRST = True
+
+# "lxml" and "lexbor" parse faster but may build a different tree than the original "html.parser" on broken markup
+HTML_PARSER_BACKEND = "html.parser"
+
+WALMART_SNAPSHOT_MODE = True
+WALMART_MAX_LISTING_PAGES = 20
+WALMART_LISTING_RETRIES = 3
+
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_PATH = ".cache/pages.sqlite3"
+PAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PAGE_CACHE_TTLS = {
+    "listing": 60 * 60,
+    "product": 6 * 60 * 60,
+    "reviews": 12 * 60 * 60,
+    "description": 24 * 60 * 60,
+    "feedback": 12 * 60 * 60,
+    "default": 60 * 60,
+}
+
+# unchanged products are served from their last record, fully scraped again once it is older than the max age
+FINGERPRINT_ENABLED = True
+FINGERPRINT_PATH = ".cache/fingerprints.sqlite3"
+FINGERPRINT_MAX_AGE = 7 * 24 * 60 * 60
+
+RESULT_STORE_ENABLED = True
+RESULT_STORE_PATH = ".cache/results.sqlite3"
+RESULT_STORE_BATCH_SIZE = 50
+RESULT_STORE_FLUSH_INTERVAL = 2
+
+WALMART_JSON_FAST_PATH = True
+
+RESOURCE_ACCOUNTING = True
+TRACKER_HOSTS = ["*.doubleclick.net", "*.googlesyndication.com", "*.google-analytics.com", "*.googletagmanager.com",
+                 "*.googleadservices.com", "*.facebook.net", "*.criteo.com", "*.scorecardresearch.com"]
+RESOURCE_POLICIES = {
+    "default": {"block_types": [], "deny_hosts": [], "allow_hosts": []},
+    "amazon": {
+        "block_types": ["image", "media", "font"],
+        "deny_hosts": TRACKER_HOSTS + ["*.amazon-adsystem.com", "fls-na.amazon.com", "unagi.amazon.com"],
+        "allow_hosts": [],
+    },
+    "ebay": {
+        "block_types": ["image", "media", "font"],
+        "deny_hosts": TRACKER_HOSTS,
+        "allow_hosts": [],
+    },
+    "walmart": {
+        "block_types": ["media", "font"],
+        "deny_hosts": TRACKER_HOSTS + ["beacon.walmart.com", "b.wal.co"],
+        "allow_hosts": [],
+    },
+}
+
+ARCHIVE_MODE = None  # "record" or "replay"
+ARCHIVE_PATH = ".cache/archive.sqlite3"
+REPLAY_HOST = "127.0.0.1"
+REPLAY_PORT = 8765
+
+WAIT_TIMEOUT = 5
+WAIT_POLL_INTERVAL = 0.1
+WAIT_QUIET_PERIOD = 0.3
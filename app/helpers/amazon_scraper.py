@@ -1,31 +1,37 @@
+import math
 import time
 import unicodedata
-from bs4 import BeautifulSoup as bs
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 import undetected_chromedriver as uc
 
 from selenium_stealth import stealth
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from selenium.webdriver import Firefox
+from app.config import AMAZON_CONCURRENCY, AMAZON_HTTP_FIRST, AMAZON_MAX_LISTING_PAGES
+from app.helpers.blocking import BlockedError, detect_block, get_unblocked_page
+from app.helpers.budget import NO_BUDGET
+from app.helpers.driver_pool import get_driver_pool
+from app.helpers.fingerprints import fingerprint_store, get_sections_fingerprint
+from app.helpers.http_client import fetch, fetch_all
+from app.helpers.metrics import observe_page_fetch, timed_extractor, tracked_scrape
+from app.helpers.page_cache import page_cache
+from app.helpers.parser import get_soup
+from app.helpers.resource_policy import record_page_resources
+from app.helpers.result_store import stored_product
+from app.helpers.waits import wait_for_dom_settled, wait_for_element
 
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/119.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+}
 
-def get_firefox_driver():
-    """ This method is used to get the Firefox driver """
+driver_pool = get_driver_pool("amazon")
 
-    options = FirefoxOptions()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--start-maximized')
-    options.add_argument('--disable-infobars')
-    options.add_argument('--disable-extensions')
-    options.add_argument('--disable-popup-blocking')
-    options.add_argument('--disable-dev-shm-usage')
-
-    driver = Firefox(options=options)
-
-    return driver
+LISTING_MARKER = "div.s-result-item"
+REVIEWS_MARKER = "div.a-section.review"
+REVIEWS_PER_PAGE = 10
 
 
 def get_chrome_driver():
@@ -57,19 +63,103 @@ def get_chrome_driver():
     return driver
 
 
-def get_page_source_code(driver, url):
-    """ This method is used to get the page source code from the url """
+def record_fetch(url, path, started_at, elapsed=None, page_type=None):
+    """ This method is used to record which path served the page """
+
+    if elapsed is None:
+        elapsed = time.time() - started_at
+    # http fetches are timed by the http client itself
+    if path != "http":
+        observe_page_fetch("amazon", page_type, path, elapsed)
+    print(f"[+ Amazon +] Fetched {url} via {path} in {elapsed:.2f}s")
+
+
+def get_cached_page_source_code(url, marker=None, page_type=None):
+    """ This method is used to get the page from the page cache, None on a miss """
 
-    driver.get(url)
+    if page_type and (page_source := page_cache.get(url, page_type)) is not None:
+        started_at = time.time()
+        soup = get_soup(page_source)
+        if not marker or soup.select_one(marker):
+            record_fetch(url, "cache", started_at, page_type=page_type)
+            return soup
+    return None
 
-    soup = get_soup(driver.page_source)
+
+def check_http_response(url, response, marker, page_type=None):
+    """ This method is used to parse an http response, None when it is a block page or lacks the marker """
+
+    if response is None or detect_block("amazon", response) or response.status_code != 200:
+        return None
+    soup = get_soup(response.content)
+    if soup.select_one(marker):
+        if page_type and not getattr(response, "from_cache", False):
+            page_cache.put(url, page_type, response.content)
+        return soup
+    return None
+
+
+def get_page_source_code_over_http(url, marker, page_type=None):
+    """ This method is used to get the page over plain http, None when the marker is missing """
+
+    try:
+        response = fetch(url, headers=HTTP_HEADERS, page_type=page_type, cache=False)
+    except Exception as e:
+        print(f"[+ Amazon +] Exception raised, {e}")
+        return None
+    return check_http_response(url, response, marker, page_type)
+
+
+def get_page_source_code_over_browser(driver, url, marker=None, page_type=None, budget=NO_BUDGET):
+    """ This method is used to get the page through the browser, raising BlockedError when it stays blocked """
+
+    started_at = time.time()
+    get_unblocked_page(driver, url, "amazon", budget)
+
+    page_source = driver.page_source
+    soup = get_soup(page_source)
+    record_fetch(url, "browser", started_at, page_type=page_type)
+    record_page_resources(driver, "amazon", url)
+    if page_type and (not marker or soup.select_one(marker)):
+        page_cache.put(url, page_type, page_source)
     return soup
 
 
-def get_soup(page_source):
-    """ This method is used to get the html parser using page source """
+def get_page_source_code(driver, url, marker=None, page_type=None, budget=NO_BUDGET):
+    """ This method is used to get the page source code from the url """
+
+    if soup := get_cached_page_source_code(url, marker, page_type):
+        return soup
+
+    if marker and AMAZON_HTTP_FIRST:
+        started_at = time.time()
+        if soup := get_page_source_code_over_http(url, marker, page_type):
+            record_fetch(url, "http", started_at, page_type=page_type)
+            return soup
+
+    return get_page_source_code_over_browser(driver, url, marker, page_type, budget)
+
+
+def iter_page_source_codes(driver, urls, marker, page_type=None, budget=NO_BUDGET):
+    """ This method is used to get many pages in order, fetching them concurrently over http first
+
+    Pages missing the marker are loaded through the browser only when the caller iterates up to them,
+    so a caller that stops early saves those browser loads.
+    """
+
+    soups = [get_cached_page_source_code(url, marker, page_type) for url in urls]
 
-    return bs(page_source, 'html.parser')
+    if AMAZON_HTTP_FIRST and (missing := [i for i, soup in enumerate(soups) if soup is None]):
+        started_at = time.time()
+        responses = fetch_all([urls[i] for i in missing], headers=HTTP_HEADERS, page_type=page_type, cache=False)
+        elapsed = (time.time() - started_at) / len(missing)
+        for i, response in zip(missing, responses):
+            if soup := check_http_response(urls[i], response, marker, page_type):
+                soups[i] = soup
+                record_fetch(urls[i], "http", started_at, elapsed, page_type)
+
+    for url, soup in zip(urls, soups):
+        yield soup or get_page_source_code_over_browser(driver, url, marker, page_type, budget)
 
 
 def remove_unicode_chars(input_string):
@@ -78,79 +168,112 @@ def remove_unicode_chars(input_string):
     return ''.join(c for c in input_string if unicodedata.category(c)[0] != 'C')
 
 
-def scrap_product_listing_url(driver, keyword, number_of_products=5):
-    """ This method is used to scrap the product list from the url """
+@timed_extractor("amazon")
+def get_listing_asins(soup):
+    """ This method is used to get the asins of the results of a search page """
+
+    asin_list_tag = soup.find_all('div', attrs={
+        'class': 'sg-col-4-of-24 sg-col-4-of-12 s-result-item s-asin sg-col-4-of-16 sg-col s-widget-spacing-small sg-col-4-of-20'})
+    if not asin_list_tag:
+        asin_list_tag = soup.find_all('div', attrs={'class': 's-result-item'})
+    return [data_asin.get('data-asin', '').strip() for data_asin in asin_list_tag]
+
+
+def scrap_product_listing_url(driver, keyword, number_of_products=5, budget=NO_BUDGET):
+    """ This method is used to scrap the product list from the url
+
+    Paging stops at the last page with results, after AMAZON_MAX_LISTING_PAGES pages or when the budget runs out.
+    """
 
     keyword = "+".join(keyword.split(" "))
     page_num = 1
     product_links = []
 
-    searching = True
-
-    while searching:
+    while len(product_links) < number_of_products and page_num <= AMAZON_MAX_LISTING_PAGES:
+        if budget.expired():
+            print(f"[+ Amazon +] Time budget exhausted while listing {keyword}")
+            break
         url = f"https://www.amazon.com/s?k={keyword}&page={page_num}"
         print(f"[+ Amazon +] Scrapping {url} page {page_num}")
 
-        soup = get_page_source_code(driver, url)
-        if soup:
-            asin_list_tag = soup.find_all('div', attrs={
-                'class': 'sg-col-4-of-24 sg-col-4-of-12 s-result-item s-asin sg-col-4-of-16 sg-col s-widget-spacing-small sg-col-4-of-20'})
-            if not asin_list_tag:
-                asin_list_tag = soup.find_all('div', attrs={'class': 's-result-item'})
-            for data_asin in asin_list_tag:
-                if asin := data_asin['data-asin']:
-
-                    if len(product_links) != number_of_products:
-                        product_links.append(f"https://amazon.com/dp/{asin.strip()}")
-
-                    else:
-                        searching = False
-                        break
-            page_num += 1
+        try:
+            soup = get_page_source_code(driver, url, LISTING_MARKER, "listing", budget)
+        except BlockedError as e:
+            print(f"[+ Amazon +] {e}, stopping the listing of {keyword}")
+            break
+        asins = get_listing_asins(soup)
+        if not any(asins):
+            print(f"[+ Amazon +] No results on page {page_num} for {keyword}")
+            break
+        for asin in filter(None, asins):
+            if len(product_links) >= number_of_products:
+                break
+            product_links.append(f"https://amazon.com/dp/{asin}")
+        page_num += 1
 
     return product_links
 
 
-def get_reviews(driver, reviews_url, number_of_reviews=5):
-    """ This method is used to get the product reviews from the review url """
+@timed_extractor("amazon")
+def parse_reviews(soup):
+    """ This method is used to parse the reviews of a review page """
 
-    page_num = 1
     reviews = []
+    for review in soup.select("div.a-section.review.aok-relative"):
+        review_title = review.find('a', {'data-hook': "review-title"}).find_all('span')
+        review_title = [r.text.strip() for r in review_title][-1]
 
-    while True:
-        if len(reviews) >= number_of_reviews:
-            break
-        soup = get_page_source_code(driver, reviews_url + "&pageNumber=" + str(page_num))
-        reviews_list_tag = soup.select("div.a-section.review.aok-relative")
+        review_text = "\n".join([text.get_text(strip=True) for text in review.select(
+            ".review-text-content span")])
 
-        for review in reviews_list_tag:
-            review_title = review.find('a', {'data-hook': "review-title"}).find_all('span')
-            review_title = [r.text.strip() for r in review_title][-1]
+        rating_element = review.find('i', {'class': 'a-icon-star'})
 
-            review_text = "\n".join([text.get_text(strip=True) for text in review.select(
-                ".review-text-content span")])
+        rating = rating_element.find('span', {'class': 'a-icon-alt'}).text
+        txt = clean_text(review_text)
 
-            rating_element = review.find('i', {'class': 'a-icon-star'})
+        helpful_element = review.find('span', {'data-hook': 'helpful-vote-statement'})
+        if helpful_element:
+            helpful_text = extract_number_from_string(helpful_element.text)
+        else:
+            helpful_text = 0
 
-            rating = rating_element.find('span', {'class': 'a-icon-alt'}).text
-            txt = clean_text(review_text)
+        reviews.append(
+            {'review_title': review_title, "review_text": txt, "rating": rating, "helpful_count": helpful_text})
+    return reviews
 
-            helpful_element = review.find('span', {'data-hook': 'helpful-vote-statement'})
-            if helpful_element:
-                helpful_text = extract_number_from_string(helpful_element.text)
-            else:
-                helpful_text = 0
 
-            reviews.append(
-                {'review_title': review_title, "review_text": txt, "rating": rating, "helpful_count": helpful_text})
+@timed_extractor("amazon")
+def get_reviews(driver, reviews_url, number_of_reviews=5, budget=NO_BUDGET):
+    """ This method is used to get the product reviews from the review url
 
-            if len(reviews) >= number_of_reviews:
-                break
+    The first page confirms the review url and page size, then the remaining pages are fetched concurrently
+    and merged in page order, stopping at the first short page or when the budget runs out.
+    """
 
-        if len(reviews_list_tag) < 10:
-            break
-
-        page_num += 1
+    if number_of_reviews <= 0 or budget.expired():
+        return []
+    try:
+        soup = get_page_source_code(driver, reviews_url + "&pageNumber=1", REVIEWS_MARKER, "reviews", budget)
+    except BlockedError as e:
+        print(f"[+ Amazon +] {e}, skipping the reviews")
+        return []
+    reviews = parse_reviews(soup)
+    page_size = len(reviews)
+    if page_size >= number_of_reviews or page_size < REVIEWS_PER_PAGE:
+        return reviews[:number_of_reviews]
+
+    number_of_pages = math.ceil(number_of_reviews / page_size)
+    urls = [reviews_url + "&pageNumber=" + str(page_num) for page_num in range(2, number_of_pages + 1)]
+    try:
+        for soup in iter_page_source_codes(driver, urls, REVIEWS_MARKER, "reviews", budget):
+            if budget.expired():
+                break
+            page_reviews = parse_reviews(soup)
+            reviews.extend(page_reviews)
+            if len(page_reviews) < page_size:
+                break
+    except BlockedError as e:
+        print(f"[+ Amazon +] {e}, keeping the reviews found so far")
 
     return reviews[:number_of_reviews]
 
@@ -165,6 +288,7 @@ def clean_text(text):
     return cleaned_text.strip()
 
 
+@timed_extractor("amazon")
 def get_rate_by_feature(soup):
     """ This method is used to get the rate by feature """
 
@@ -180,6 +304,7 @@ def get_rate_by_feature(soup):
     return rating_by_features
 
 
+@timed_extractor("amazon")
 def get_product_details(soup):
     """ This method is used to get the product details """
 
@@ -196,6 +321,7 @@ def get_product_details(soup):
     return details
 
 
+@timed_extractor("amazon")
 def get_sizes(soup):
     """ This method is used to get the sizes of product """
 
@@ -211,6 +337,7 @@ def get_sizes(soup):
     return sizes
 
 
+@timed_extractor("amazon")
 def get_technical_details(soup):
     """ This method is used to get the technical details """
 
@@ -228,16 +355,17 @@ def get_technical_details(soup):
     return table_data
 
 
+@timed_extractor("amazon")
 def get_read_review_keyword(driver, soup):
     """ This method is used to read the review keywords """
 
     if read_review_tag := soup.select_one(".cr-lighthouse-terms"):
         tags = [tag.text.strip() for tag in read_review_tag.select(".a-declarative")]
         return tags
-    else:
+    elif driver is not None:
         review_element = driver.find_element(By.CSS_SELECTOR, "#reviewsMedley h2")
         scroll_page_with_pagedown(driver, review_element)
-        time.sleep(1)
+        wait_for_element(driver, ".cr-lighthouse-terms", "amazon.review_keywords", timeout=1)
         soup = get_soup(driver.page_source)
         if read_review_tag := soup.select_one(".cr-lighthouse-terms"):
             tags = [tag.text.strip() for tag in read_review_tag.select(".a-declarative")]
@@ -245,6 +373,7 @@ def get_read_review_keyword(driver, soup):
     return []
 
 
+@timed_extractor("amazon")
 def get_color_variant(soup):
     """ This method is used to get the color variant keywords """
 
@@ -265,6 +394,7 @@ def get_color_variant(soup):
     return color_variants
 
 
+@timed_extractor("amazon")
 def get_accessories(soup):
     """ This method is used to get the accessories of the product """
 
@@ -276,6 +406,7 @@ def get_accessories(soup):
     return accessories
 
 
+@timed_extractor("amazon")
 def get_about_item(soup):
     """ This method is used to get about item """
 
@@ -292,16 +423,18 @@ def get_about_item(soup):
     return about_item
 
 
+@timed_extractor("amazon")
 def get_size_chart(soup):
     """ This method is used to get the size-chart of the product """
 
-    if size_chart_element := soup.select_one(".apm-centerthirdcol.apm-wrap ul.a-unordered-list.a-vertical"):
+    if size_chart_element := soup.select_one(SIZE_CHART_SELECTOR):
         li_item = size_chart_element.select("li span.a-list-item")
         size_chart = [li.text.strip() for li in li_item]
         return size_chart
     return []
 
 
+@timed_extractor("amazon")
 def get_image_urls(soup):
     """ This method is used to get the image urls of the product """
 
@@ -320,6 +453,7 @@ def get_image_urls(soup):
     return images
 
 
+@timed_extractor("amazon")
 def get_customer_retry_reviews(soup):
     title_rating_tag = soup.select_one('div', {'id': 'cm_cr_dp_d_rating_histogram'})
 
@@ -334,6 +468,7 @@ def get_customer_retry_reviews(soup):
     return title_ratings
 
 
+@timed_extractor("amazon")
 def get_customer_reviews(soup):
     """ This method is used to get the customer reviews of the product """
 
@@ -350,6 +485,7 @@ def get_customer_reviews(soup):
     return title_ratings
 
 
+@timed_extractor("amazon")
 def get_product_overview(soup):
     """ This method is used to get the product overview """
 
@@ -370,6 +506,7 @@ def get_product_overview(soup):
     return product_overview
 
 
+@timed_extractor("amazon")
 def get_warranty(soup):
     """ This method is used to get the warranty of the product """
 
@@ -386,6 +523,7 @@ def scroll_page_with_pagedown(driver, element):
     driver.execute_script("arguments[0].scrollIntoView();", element)
 
 
+@timed_extractor("amazon")
 def get_total_ratings(soup):
     """ This method is used to get the total rating of product """
 
@@ -395,6 +533,7 @@ def get_total_ratings(soup):
     return ""
 
 
+@timed_extractor("amazon")
 def get_price(soup):
     """ This method is used to get the price of the product """
 
@@ -441,45 +580,127 @@ def extract_number_from_string(input_string):
     return 0
 
 
-def get_product_data(driver, product_url, keyword, number_of_reviews):
-    """ This method is used to get the product data """
+NO_REVIEWS_SECTION_IDS = ("reviewsMedley",)
+SIZE_CHART_SELECTOR = ".apm-centerthirdcol.apm-wrap ul.a-unordered-list.a-vertical"
+CATEGORY_SELECTOR = "li:nth-of-type(1) .a-color-tertiary"
+SIZE_CHART_SECTION_IDS = ("featurebullets_feature_div", "productDescription", "aplus", "detailBullets_feature_div")
+FINGERPRINT_SELECTORS = ("#productTitle", "#title", "#corePriceDisplay_desktop_feature_div", "#corePrice_feature_div",
+                         "#apex_desktop", "#feature-bullets", "#productDescription", "#altImages", "#twister",
+                         "#detailBullets_feature_div", "#prodDetails", "#averageCustomerReviews", "#histogramTable",
+                         ".averageStarRatingNumerical", "#cr-dp-summarization-attributes")
+
+
+def index_sections(soup):
+    """ This method is used to index every element with an id in a single walk of the page """
+
+    sections = {}
+    for tag in soup.find_all(id=True):
+        sections.setdefault(tag.get("id"), tag)
+    return sections
+
+
+def get_product_fingerprint(soup):
+    """ This method is used to fingerprint the product sections, review count and rating summary of the page """
+
+    return get_sections_fingerprint(soup, FINGERPRINT_SELECTORS)
+
+
+def get_section(sections, section_id):
+    """ This method is used to get a section root, an empty tree when the page has none """
+
+    section = sections.get(section_id)
+    return section if section is not None else get_soup("")
+
+
+def get_section_scope(sections, section_id):
+    """ This method is used to get the smallest subtree in which a selector anchored on the section can match """
+
+    if (section := sections.get(section_id)) is not None:
+        return section.parent
+    return get_soup("")
+
+
+def get_scoped(extractor, sections, section_id, soup, get_scope=get_section):
+    """ This method is used to run an extractor on its section, on the whole page only when the page has no such
+    section
+    """
+
+    if section_id not in sections:
+        return extractor(soup)
+    return extractor(get_scope(sections, section_id))
+
+
+def has_size_chart(sections, soup):
+    """ This method is used to check for a size chart in the sections naming one or around the size chart list """
+
+    if has_section_text(sections, SIZE_CHART_SECTION_IDS, "size chart:"):
+        return True
+    size_chart_tag = soup.select_one(SIZE_CHART_SELECTOR)
+    return size_chart_tag is not None and "size chart:" in size_chart_tag.parent.get_text().lower()
+
+
+def has_section_text(sections, section_ids, text):
+    """ This method is used to check for a text inside the given sections only """
+
+    return any(text in sections[section_id].get_text().lower() for section_id in section_ids if section_id in sections)
+
+
+@stored_product("amazon")
+@timed_extractor("amazon")
+def get_product_data(driver, product_url, keyword, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to get the product data, reusing the last record when the page did not change """
 
     data = {}
 
     print(f"[+ Amazon +] Scraping data from {product_url}")
     try:
-        driver.get(product_url)
-        review_element = driver.find_element(By.CSS_SELECTOR, "#reviewsMedley h2")
-        scroll_page_with_pagedown(driver, review_element)
-        time.sleep(1)
-        soup = get_soup(driver.page_source)
-        if title_tag := soup.select_one("h1#title"):
+        if (page_source := page_cache.get(product_url, "product")) is not None:
+            live_driver = None
+        else:
+            get_unblocked_page(driver, product_url, "amazon", budget)
+            review_element = driver.find_element(By.CSS_SELECTOR, "#reviewsMedley h2")
+            scroll_page_with_pagedown(driver, review_element)
+            wait_for_dom_settled(driver, "amazon.product_scroll")
+            page_source = driver.page_source
+            record_page_resources(driver, "amazon", product_url)
+            page_cache.put(product_url, "product", page_source)
+            live_driver = driver
+        soup = get_soup(page_source)
+        sections = index_sections(soup)
+        reviews_root = get_section(sections, "reviewsMedley")
+
+        fingerprint = get_product_fingerprint(soup)
+        if product := fingerprint_store.get("amazon", product_url, fingerprint, number_of_reviews, keyword):
+            print(f"[+ Amazon +] Unchanged since the last scrape, reusing {product_url}")
+            return product
+
+        if (title_tag := sections.get("title")) and title_tag.name == "h1":
             title = clean_text(title_tag.get_text(strip=True))
             data["title"] = title
 
-        elif title_tag := soup.select_one("#productTitle"):
+        elif title_tag := sections.get("productTitle"):
             title = clean_text(title_tag.text.strip())
             data["title"] = title
         data["url"] = product_url
 
-        if "No customer reviews".lower() not in soup.text.lower():
-            ratings = soup.select_one("#reviewsMedley .a-size-medium").get_text(strip=True)
+        if not has_section_text(sections, NO_REVIEWS_SECTION_IDS, "no customer reviews"):
+            ratings = reviews_root.select_one(".a-size-medium").get_text(strip=True)
         else:
             ratings = "N/A"
         data["ratings"] = ratings
 
         size_chart = "N/A"
-        if "size chart:" in soup.text.lower():
-            size_chart = get_size_chart(soup)
+        if has_size_chart(sections, soup):
+            size_chart = get_scoped(get_size_chart, sections, "aplus", soup)
         data["size_chart"] = size_chart
 
-        price = get_price(soup)
+        price = get_scoped(get_price, sections, "centerCol", soup)
         data['price'] = price
 
-        images = get_image_urls(soup)
+        images = get_image_urls(get_section_scope(sections, "altImages"))
         data["images"] = images
 
-        description = "\n".join([desc.text.strip() for desc in soup.select("#productDescription span")])
+        description = "\n".join([desc.text.strip() for desc in get_section(sections, "productDescription").select("span")])
         if not description:
             try:
                 description = soup.find('div', {'class': 'aplus-v2 desktop celwidget'}).text.strip()
@@ -488,74 +709,125 @@ def get_product_data(driver, product_url, keyword, number_of_reviews):
                 description = ""
         data["description"] = description
 
-        details = get_product_details(soup)
-        sizes = get_sizes(soup)
+        details = get_product_details(get_section_scope(sections, "detailBullets_feature_div"))
+        sizes = get_scoped(get_sizes, sections, "centerCol", soup)
         data["sizes"] = sizes
-        rating_by_features = get_rate_by_feature(soup)
+        rating_by_features = get_rate_by_feature(get_section_scope(sections, "cr-dp-summarization-attributes"))
         data["rating_by_features"] = rating_by_features
-        total_ratings = get_total_ratings(soup)
+        total_ratings = get_scoped(get_total_ratings, sections, "reviewsMedley", soup)
         data["total_ratings"] = total_ratings
 
-        table_data = get_technical_details(soup)
-        category = soup.select_one("li:nth-of-type(1) .a-color-tertiary").get_text(strip=True)
+        table_data = get_scoped(get_technical_details, sections, "prodDetails", soup, get_section_scope)
+        category_tag = (sections.get("wayfinding-breadcrumbs_feature_div") or soup).select_one(CATEGORY_SELECTOR)
+        category = (category_tag or soup.select_one(CATEGORY_SELECTOR)).get_text(strip=True)
         data["category"] = category
 
         details.update(table_data)
         data["product_info"] = details
 
-        read_reviews_keywords = get_read_review_keyword(driver, soup)
+        read_reviews_keywords = get_read_review_keyword(live_driver, reviews_root)
         data["read_review_keywords"] = read_reviews_keywords
 
-        color_variants = get_color_variant(soup)
+        color_variants = get_scoped(get_color_variant, sections, "centerCol", soup)
         data["color_variants"] = color_variants
-        about_item = get_about_item(soup)
+        about_item = get_scoped(get_about_item, sections, "centerCol", soup)
         data["about_item"] = about_item
-        warranty = get_warranty(soup)
+        warranty = get_warranty(get_section_scope(sections, "productDetails_warranty_support_sections"))
         data["warranty"] = warranty
-        accessories = get_accessories(soup)
+        accessories = get_scoped(get_accessories, sections, "centerCol", soup)
         data["accessories"] = accessories
-        product_overview = get_product_overview(soup)
+        product_overview = get_scoped(get_product_overview, sections, "centerCol", soup)
         data["overview"] = product_overview
 
-        customer_reviews = get_customer_reviews(soup)
+        customer_reviews = get_scoped(get_customer_reviews, sections, "reviewsMedley", soup)
         if not customer_reviews:
             customer_reviews = get_customer_retry_reviews(soup)
         data["customer_reviews"] = customer_reviews
         data["SEARCH_KEYWORD"] = keyword
 
-        if reviews_url := soup.select_one("#cr-pagination-footer-0 .a-text-bold"):
+        if reviews_url := get_section_scope(sections, "cr-pagination-footer-0").select_one(
+                "#cr-pagination-footer-0 .a-text-bold"):
             reviews_url = "https://www.amazon.com" + reviews_url.get("href")
-            reviews = get_reviews(driver, reviews_url, number_of_reviews)
+            reviews = get_reviews(driver, reviews_url, number_of_reviews, budget)
         else:
-            reviews_url = "https://www.amazon.com" + soup.find('a', {'data-hook': "see-all-reviews-link-foot"})['href']
-            reviews = get_reviews(driver, reviews_url, number_of_reviews)
+            reviews_url = "https://www.amazon.com" + reviews_root.find('a', {'data-hook': "see-all-reviews-link-foot"})['href']
+            reviews = get_reviews(driver, reviews_url, number_of_reviews, budget)
         data["reviews"] = reviews
+        if budget.exhausted and len(reviews) < number_of_reviews:
+            data["partial"] = True
 
-        return data
+        return fingerprint_store.put("amazon", product_url, fingerprint, number_of_reviews, data)
+    except BlockedError as e:
+        print(f"[+ Amazon +] {e}, skipping the product")
+        return {"url": product_url, "SEARCH_KEYWORD": keyword, "error": str(e)}
     except Exception as e:
         print(f"[+ Amazon +] Exception raised, {e}")
         return data
 
 
-def scrap_amazon(keyword, number_of_products, number_of_reviews):
-    """ This is the main method of the scrapper """
+def get_product_links(keyword, number_of_products, budget=NO_BUDGET):
+    """ This method is used to get the product links of the keyword on a driver borrowed from the pool """
 
-    print(f"[+ Amazon +] Search Keyword: {keyword}")
+    with driver_pool.driver() as driver:
+        return scrap_product_listing_url(driver, keyword, number_of_products, budget)
 
-    driver = get_firefox_driver()
 
-    product_links = scrap_product_listing_url(driver, keyword, number_of_products)
+def scrap_product_with_pooled_driver(product_url, keyword, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to scrap one product on a driver borrowed from the pool """
+
+    if budget.expired():
+        return {"url": product_url, "partial": True}
+    try:
+        with driver_pool.driver() as driver:
+            return get_product_data(driver, product_url, keyword, number_of_reviews, budget)
+    except Exception as e:
+        print(f"[+ Amazon +] Exception raised for {product_url}, {e}")
+        return {"url": product_url, "error": str(e)}
+
+
+@tracked_scrape("amazon")
+def iter_amazon(keyword, number_of_products, number_of_reviews, concurrency=AMAZON_CONCURRENCY, budget=NO_BUDGET):
+    """ This method is used to scrap amazon yielding (position, total, product) as each product finishes
+
+    Products still being scraped when the budget runs out are not waited for.
+    """
+
+    print(f"[+ Amazon +] Search Keyword: {keyword}")
+
+    with driver_pool.driver() as driver:
+        product_links = scrap_product_listing_url(driver, keyword, number_of_products, budget)
 
     print(f"[+ Amazon +] Product Link is found for {keyword}")
     print(f"[+ Amazon +] Links: {product_links}")
 
-    product_information = []
-    if product_links:
-        for product_url in product_links:
-            result = get_product_data(driver, product_url, keyword, number_of_reviews)
-            product_information.append(result)
-    else:
+    if not product_links:
         print("[+ Amazon +] Unable to fetch product links")
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max(min(concurrency, len(product_links)), 1))
+    try:
+        futures = {executor.submit(scrap_product_with_pooled_driver, product_url, keyword, number_of_reviews,
+                                   budget): position
+                   for position, product_url in enumerate(product_links)}
+        timeout = None if budget.deadline is None else budget.remaining()
+        for future in as_completed(futures, timeout=timeout):
+            yield futures[future], len(product_links), future.result()
+    except TimeoutError:
+        budget.exhausted = True
+        print(f"[+ Amazon +] Time budget exhausted, dropping the products still running for {keyword}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def scrap_amazon(keyword, number_of_products, number_of_reviews, progress_callback=None,
+                 concurrency=AMAZON_CONCURRENCY, budget=NO_BUDGET):
+    """ This is the main method of the scrapper """
+
+    products = {}
+    for position, total, product in iter_amazon(keyword, number_of_products, number_of_reviews, concurrency,
+                                                budget):
+        products[position] = product
+        if progress_callback:
+            progress_callback(len(products), total)
 
-    driver.quit()
-    return product_information
+    return [products[position] for position in sorted(products)]
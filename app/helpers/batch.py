@@ -0,0 +1,247 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+from app.config import BATCH_WORKERS, BATCH_SITE_CONCURRENCY, BATCH_HISTORY_SIZE
+from app.helpers.budget import TimeBudget
+
+
+def normalize_keywords(keywords):
+    """ This method is used to de-duplicate keywords ignoring case and spacing, keeping the first spelling """
+
+    unique = OrderedDict()
+    for keyword in keywords:
+        keyword = " ".join(keyword.split())
+        if keyword:
+            unique.setdefault(keyword.lower(), keyword)
+    return list(unique.values())
+
+
+class BatchScheduler:
+    """ Shared workers running the listing and product scrapes of many batches, taking turns between sites
+
+    Every site has its own queue and at most its site_concurrency tasks running, so a site with hundreds of products
+    queued never starves the others. The sites still share the browsers of the driver limit, so a task may wait for
+    a driver; one timing out is recorded as failed and the other tasks of the batch go on.
+    """
+
+    def __init__(self, workers=BATCH_WORKERS, site_concurrency=BATCH_SITE_CONCURRENCY,
+                 history_size=BATCH_HISTORY_SIZE):
+        self.workers = workers
+        self.site_concurrency = site_concurrency
+        self.history_size = history_size
+
+        self._queues = OrderedDict()
+        self._running = defaultdict(int)
+        self._batches = OrderedDict()
+        self._threads = []
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def get_site_concurrency(self, site):
+        return self.site_concurrency.get(site, self.site_concurrency["default"])
+
+    def _start(self):
+        """ This method is used to start the workers on the first batch """
+
+        if not self._threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"batch-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, scrapers, keywords, number_of_products, number_of_reviews, time_budget=None):
+        """ This method is used to queue the scrape of every keyword on every site and return the batch id
+
+        scrapers maps each site to its (get_product_links, scrap_product) pair. The time budget covers the whole
+        batch rather than each task, so it defaults to none; tasks still queued when it runs out are skipped.
+        """
+
+        keywords = normalize_keywords(keywords)
+        batch_id = uuid.uuid4().hex
+        batch = {
+            "batch_id": batch_id,
+            "status": "queued",
+            "keywords": keywords,
+            "sites": list(scrapers),
+            "number_of_products": number_of_products,
+            "number_of_reviews": number_of_reviews,
+            "scrapers": scrapers,
+            "budget": TimeBudget(time_budget),
+            "pending": 0,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "links": {site: {} for site in scrapers},
+            "products": {},
+            "errors": [],
+            "stats": {site: {"listings": 0, "products": 0, "duplicates": 0, "failed": 0, "skipped": 0,
+                             "busy_seconds": 0.0}
+                      for site in scrapers},
+        }
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Batch scheduler is closed")
+            self._start()
+            self._batches[batch_id] = batch
+            self._trim()
+            for site in scrapers:
+                for keyword in keywords:
+                    self._push(site, ("listing", batch, site, keyword), front=True)
+            if not batch["pending"]:
+                batch["status"] = "finished"
+                batch["finished_at"] = time.time()
+            self._condition.notify_all()
+        return batch_id
+
+    def _push(self, site, task, front=False):
+        """ This method is used to queue a task, the condition lock being held """
+
+        queue = self._queues.setdefault(site, deque())
+        queue.appendleft(task) if front else queue.append(task)
+        task[1]["pending"] += 1
+
+    def _next_task(self):
+        """ This method is used to take the next task, rotating over the sites with work and a free slot """
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                for site in list(self._queues):
+                    if self._queues[site] and self._running[site] < self.get_site_concurrency(site):
+                        self._queues.move_to_end(site)
+                        self._running[site] += 1
+                        return self._queues[site].popleft()
+                self._condition.wait()
+
+    def _work(self):
+        """ This method is used to run tasks until the scheduler closes """
+
+        while (task := self._next_task()) is not None:
+            kind, batch, site = task[:3]
+            started_at = time.time()
+            if batch["started_at"] is None:
+                batch["started_at"], batch["status"] = started_at, "running"
+            try:
+                if batch["budget"].expired():
+                    batch["stats"][site]["skipped"] += 1
+                elif kind == "listing":
+                    self._run_listing(batch, site, task[3])
+                else:
+                    self._run_product(batch, site, task[3], task[4])
+            except Exception as e:
+                print(f"[+ Batch +] Exception raised in {kind} task for {site}, {e}")
+                batch["errors"].append({"site": site, "task": kind, "target": task[3], "error": str(e)})
+                batch["stats"][site]["failed"] += 1
+
+            with self._condition:
+                batch["stats"][site]["busy_seconds"] += time.time() - started_at
+                self._running[site] -= 1
+                batch["pending"] -= 1
+                if not batch["pending"]:
+                    batch["status"] = "finished"
+                    batch["finished_at"] = time.time()
+                self._condition.notify_all()
+
+    def _run_listing(self, batch, site, keyword):
+        """ This method is used to get the product links of a keyword and queue the products not queued yet """
+
+        get_product_links, _ = batch["scrapers"][site]
+        product_urls = get_product_links(keyword, batch["number_of_products"], budget=batch["budget"]) or []
+        with self._condition:
+            batch["stats"][site]["listings"] += 1
+            batch["links"][site][keyword] = product_urls
+            for product_url in product_urls:
+                key = (site, product_url)
+                if key in batch["products"]:
+                    batch["stats"][site]["duplicates"] += 1
+                    continue
+                batch["products"][key] = None
+                self._push(site, ("product", batch, site, product_url, keyword))
+
+    def _run_product(self, batch, site, product_url, keyword):
+        """ This method is used to scrape one product """
+
+        _, scrap_product = batch["scrapers"][site]
+        product = scrap_product(product_url, keyword, batch["number_of_reviews"], budget=batch["budget"])
+        with self._condition:
+            batch["products"][(site, product_url)] = product
+            batch["stats"][site]["products"] += 1
+            if product and product.get("error"):
+                batch["stats"][site]["failed"] += 1
+
+    def _trim(self):
+        """ This method is used to forget the oldest finished batches """
+
+        finished = [batch_id for batch_id, batch in self._batches.items() if batch["status"] == "finished"]
+        for batch_id in finished[:max(len(self._batches) - self.history_size, 0)]:
+            del self._batches[batch_id]
+
+    def status(self, batch_id):
+        """ This method is used to get the progress and throughput of a batch """
+
+        with self._condition:
+            if not (batch := self._batches.get(batch_id)):
+                return None
+            stats = {site: dict(site_stats) for site, site_stats in batch["stats"].items()}
+            products_done = sum(site_stats["products"] for site_stats in stats.values())
+            products_total = len(batch["products"])
+            pending = batch["pending"]
+
+        started_at = batch["started_at"]
+        elapsed = ((batch["finished_at"] or time.time()) - started_at) if started_at else 0.0
+        busy_seconds = sum(site_stats["busy_seconds"] for site_stats in stats.values())
+        for site_stats in stats.values():
+            site_stats["seconds_per_product"] = (site_stats["busy_seconds"] / site_stats["products"]
+                                                 if site_stats["products"] else None)
+        return {
+            "batch_id": batch_id,
+            "status": batch["status"],
+            "partial": batch["budget"].exhausted,
+            "keywords": len(batch["keywords"]),
+            "sites": batch["sites"],
+            "pending_tasks": pending,
+            "products_done": products_done,
+            "products_total": products_total,
+            "elapsed": round(elapsed, 3),
+            "products_per_minute": round(products_done / elapsed * 60, 2) if elapsed else 0.0,
+            "worker_utilization": round(busy_seconds / (elapsed * self.workers), 3) if elapsed else 0.0,
+            "by_site": stats,
+            "errors": list(batch["errors"]),
+        }
+
+    def results(self, batch_id):
+        """ This method is used to get the products of every keyword and site of a batch
+
+        A product found by several keywords is scraped once and reported under each of them.
+        """
+
+        with self._condition:
+            if not (batch := self._batches.get(batch_id)):
+                return None
+            results = {}
+            for site, links in batch["links"].items():
+                results[site] = {}
+                for keyword, product_urls in links.items():
+                    products = []
+                    for product_url in product_urls:
+                        if (product := batch["products"].get((site, product_url))) is None:
+                            continue
+                        if product.get("SEARCH_KEYWORD", keyword) != keyword:
+                            product = {**product, "SEARCH_KEYWORD": keyword}
+                        products.append(product)
+                    results[site][keyword] = products
+            return results
+
+    def shutdown(self):
+        """ This method is used to stop the workers once their current task is done """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+batch_scheduler = BatchScheduler()
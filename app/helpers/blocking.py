@@ -0,0 +1,196 @@
+import re
+import time
+import threading
+from urllib.parse import urlsplit
+
+from selenium.webdriver.common.by import By
+
+from app.config import BLOCK_RETRIES, BLOCK_RETRY_BACKOFF, CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_BACKOFF, \
+    CIRCUIT_BREAKER_MAX_BACKOFF
+from app.helpers.budget import NO_BUDGET
+from app.helpers.metrics import CIRCUIT_OPEN, record_block_page
+
+THROTTLED = "throttled"
+BLOCKED = "blocked"
+CAPTCHA = "captcha"
+
+THROTTLED_STATUS_CODES = (429, 503)
+BLOCK_PATHS = ("/blocked", "/splashui/captcha")
+BLOCK_TITLES = ("Security Measure", "Robot or human?", "Robot Check", "Pardon Our Interruption...")
+CAPTCHA_MARKERS = (b"/errors/validateCaptcha",)
+CAPTCHA_SELECTOR = "form[action*='validateCaptcha']"
+
+# block pages are small, so the markers are only looked for in the head of the page
+HEAD_BYTES = 64 * 1024
+TITLE_PATTERN = re.compile(rb"<title[^>]*>\s*(.*?)\s*</title>", re.IGNORECASE | re.DOTALL)
+
+
+class BlockedError(Exception):
+    """ Raised when a site keeps serving block pages """
+
+    def __init__(self, site, url, reason):
+        super().__init__(f"{site} served a {reason} page for {url}" if url else f"{site} is {reason}")
+        self.site = site
+        self.url = url
+        self.reason = reason
+
+
+def is_block_url(url):
+    """ This method is used to check whether the url is one a site redirects blocked clients to """
+
+    path = urlsplit(url or "").path.rstrip("/")
+    return any(path.endswith(block_path) for block_path in BLOCK_PATHS)
+
+
+def classify_page(content, url=None, status_code=200):
+    """ This method is used to classify a fetched page, None for a usable page
+
+    Only the status, the url and the head of the page are looked at, so it runs before any parsing.
+    """
+
+    if status_code in THROTTLED_STATUS_CODES:
+        return THROTTLED
+    if is_block_url(url):
+        return BLOCKED
+    if isinstance(content, str):
+        content = content[:HEAD_BYTES].encode("utf-8", "ignore")
+    head = (content or b"")[:HEAD_BYTES]
+    if (title := TITLE_PATTERN.search(head)) and title.group(1).decode("utf-8", "ignore") in BLOCK_TITLES:
+        return CAPTCHA
+    if any(marker in head for marker in CAPTCHA_MARKERS):
+        return CAPTCHA
+    return None
+
+
+def classify_response(response):
+    """ This method is used to classify an http response, None for a usable page """
+
+    return classify_page(response.content, response.url, response.status_code)
+
+
+def classify_driver(driver):
+    """ This method is used to classify the page loaded in the browser, None for a usable page """
+
+    if is_block_url(driver.current_url):
+        return BLOCKED
+    if driver.title in BLOCK_TITLES or driver.find_elements(By.CSS_SELECTOR, CAPTCHA_SELECTOR):
+        return CAPTCHA
+    return None
+
+
+class CircuitBreaker:
+    """ Stops the browser loads of a site for a while once it keeps serving block pages
+
+    threshold consecutive block pages open the circuit for a backoff doubling on every reopening, up to
+    max_backoff. Once the backoff is over a single block page reopens it, while a usable page closes it and
+    resets the backoff.
+    """
+
+    def __init__(self, site, threshold=CIRCUIT_BREAKER_THRESHOLD, backoff=CIRCUIT_BREAKER_BACKOFF,
+                 max_backoff=CIRCUIT_BREAKER_MAX_BACKOFF):
+        self.site = site
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._blocks = 0
+        self._trips = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+        CIRCUIT_OPEN.labels(site).set_function(self.is_open)
+
+    def is_open(self):
+        return time.monotonic() < self._open_until
+
+    def record_success(self):
+        with self._lock:
+            self._blocks = 0
+            self._trips = 0
+
+    def record_block(self):
+        """ This method is used to count a block page, opening the circuit when there were too many in a row """
+
+        with self._lock:
+            self._blocks += 1
+            if self._blocks < self.threshold or self.is_open():
+                return
+            self._trips += 1
+            delay = min(self.backoff * 2 ** (self._trips - 1), self.max_backoff)
+            self._open_until = time.monotonic() + delay
+            self._blocks = self.threshold - 1
+        print(f"[+ CircuitBreaker +] Too many block pages from {self.site}, pausing for {delay}s")
+
+    def wait(self, budget=NO_BUDGET):
+        """ This method is used to wait for the circuit to close, raising BlockedError when the budget ends first """
+
+        delay = self._open_until - time.monotonic()
+        if delay <= 0:
+            return
+        if delay > budget.remaining():
+            raise BlockedError(self.site, None, "paused by its circuit breaker")
+        time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {"open": self.is_open(), "open_for": round(max(self._open_until - time.monotonic(), 0.0), 3),
+                    "consecutive_blocks": self._blocks, "trips": self._trips}
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(site):
+    """ This method is used to get the circuit breaker of the site """
+
+    with _circuit_breakers_lock:
+        if site not in _circuit_breakers:
+            _circuit_breakers[site] = CircuitBreaker(site)
+        return _circuit_breakers[site]
+
+
+def get_circuit_breaker_stats():
+    with _circuit_breakers_lock:
+        circuit_breakers = dict(_circuit_breakers)
+    return {site: circuit_breaker.stats() for site, circuit_breaker in circuit_breakers.items()}
+
+
+def report_page(site, path, reason):
+    """ This method is used to feed the outcome of a page load to the metrics and the circuit breaker of the site """
+
+    if reason:
+        record_block_page(site, path)
+        get_circuit_breaker(site).record_block()
+    else:
+        get_circuit_breaker(site).record_success()
+
+
+def detect_block(site, response):
+    """ This method is used to classify and report an http response, None for a usable page """
+
+    reason = classify_response(response)
+    if reason or response.status_code == 200:
+        report_page(site, "http", reason)
+    return reason
+
+
+def get_unblocked_page(driver, url, site, budget=NO_BUDGET, retries=BLOCK_RETRIES):
+    """ This method is used to load a page in the browser, recycling the driver and backing off while it is blocked
+
+    The driver is recycled in place, so the caller keeps using the same, healthy, driver. Raises BlockedError when
+    the page is still blocked after the retries or the circuit of the site stays open past the budget.
+    """
+
+    circuit_breaker = get_circuit_breaker(site)
+    for attempt in range(retries + 1):
+        circuit_breaker.wait(budget)
+        driver.get(url)
+        if not (reason := driver.block_reason):
+            report_page(site, "browser", None)
+            return
+        report_page(site, "browser", reason)
+        print(f"[+ {site.capitalize()} +] {reason.capitalize()} page served to the browser for {url}")
+        if attempt < retries:
+            driver.recycle()
+            time.sleep(budget.timeout(BLOCK_RETRY_BACKOFF * 2 ** attempt))
+    raise BlockedError(site, url, reason)
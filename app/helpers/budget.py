@@ -0,0 +1,37 @@
+import math
+import time
+
+
+class TimeBudget:
+    """ Wall-clock budget shared by every stage of a scrape
+
+    Stages check the budget before starting more work and stop when it has run out; the budget then remembers
+    that the results it guarded are partial.
+    """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.deadline = None if seconds is None else time.monotonic() + seconds
+        self.exhausted = False
+
+    def remaining(self):
+        """ This method is used to get the seconds left, infinite for an unlimited budget """
+
+        if self.deadline is None:
+            return math.inf
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def expired(self):
+        """ This method is used to check whether the budget ran out, marking the results partial when it did """
+
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.exhausted = True
+        return self.exhausted
+
+    def timeout(self, default):
+        """ This method is used to cap a timeout to the seconds left """
+
+        return min(default, self.remaining())
+
+
+NO_BUDGET = TimeBudget()
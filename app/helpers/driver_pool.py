@@ -0,0 +1,300 @@
+import threading
+from functools import partial
+from contextlib import contextmanager
+
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
+from selenium.webdriver import Firefox
+
+from app.config import DRIVER_POOL_MIN_SIZES, DRIVER_POOL_MAX_SIZE, DRIVER_POOL_TOTAL_SIZE, DRIVER_MAX_PAGES, \
+    DRIVER_ACQUIRE_TIMEOUT
+from app.helpers.resource_policy import apply_resource_policy
+from app.helpers.metrics import DRIVER_STARTUP_SECONDS, LIVE_DRIVERS
+from app.helpers.blocking import classify_driver
+from app.helpers.rate_limiter import get_outcome, rate_limiter
+from app.helpers.replay import record_page, rewrite_url
+
+SITES = ("amazon", "ebay", "walmart")
+
+
+def get_firefox_driver(site=None):
+    """ This method is used to get the Firefox driver with the resource policy of the site """
+
+    options = FirefoxOptions()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--start-maximized')
+    options.add_argument('--disable-infobars')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--disable-popup-blocking')
+    options.add_argument('--disable-dev-shm-usage')
+    apply_resource_policy(options, site)
+
+    driver = Firefox(options=options)
+
+    return driver
+
+
+class PooledDriver:
+    """ Thin wrapper around a webdriver which counts the pages loaded through it, rate limits them and archives or
+    replays them
+
+    Every load is classified by the block detection; block pages are not archived and leave their reason in
+    block_reason.
+    """
+
+    def __init__(self, driver, factory=None, site="default"):
+        self.driver = driver
+        self.factory = factory
+        self.site = site
+        self.pages = 0
+        self.block_reason = None
+
+    def get(self, url):
+        self.pages += 1
+        with rate_limiter.limit(url) as permit:
+            self.driver.get(rewrite_url(url))
+            self.block_reason = classify_driver(self.driver)
+            permit.outcome = get_outcome(self.block_reason)
+        if not self.block_reason:
+            record_page(url, self.driver)
+
+    def recycle(self):
+        """ This method is used to swap the browser for a fresh one in place, so whoever holds the driver keeps a
+        healthy one
+        """
+
+        print(f"[+ DriverPool +] Recycling a {self.site} driver")
+        try:
+            self.driver.quit()
+        except Exception as e:
+            print(f"[+ DriverPool +] Exception raised while quitting driver, {e}")
+        with DRIVER_STARTUP_SECONDS.labels(self.site).time():
+            self.driver = self.factory()
+        self.pages = 0
+        self.block_reason = None
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+
+class DriverLimit:
+    """ Ceiling on the drivers live across the pools sharing it
+
+    The pools share its lock too, so a pool at the ceiling can quit an idle driver of another pool to start its own.
+    """
+
+    def __init__(self, max_size=DRIVER_POOL_TOTAL_SIZE):
+        self.max_size = max(max_size, 1)
+        self.live = 0
+        self.pools = []
+        self.condition = threading.Condition()
+
+    def has_idle(self, pool):
+        """ This method is used to check whether a pool other than the given one holds an idle driver """
+
+        return any(other._idle for other in self.pools if other is not pool)
+
+    def evict(self, pool):
+        """ This method is used to take an idle driver away from another pool, the lock being held """
+
+        for other in self.pools:
+            if other is not pool and other._idle:
+                other._live -= 1
+                self.live -= 1
+                return other._idle.pop(0)
+        return None
+
+
+class DriverPool:
+    """ Process-wide pool of warm Firefox drivers shared by the scrapers """
+
+    def __init__(self, factory=get_firefox_driver, min_size=DRIVER_POOL_MIN_SIZES["default"],
+                 max_size=DRIVER_POOL_MAX_SIZE, max_pages=DRIVER_MAX_PAGES, acquire_timeout=DRIVER_ACQUIRE_TIMEOUT,
+                 site="default", limit=None):
+        self.factory = factory
+        self.site = site
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.max_pages = max_pages
+        self.acquire_timeout = acquire_timeout
+        self.limit = limit or DriverLimit(self.max_size)
+
+        self._idle = []
+        self._live = 0
+        self._closed = False
+        self._condition = self.limit.condition
+        self.limit.pools.append(self)
+        LIVE_DRIVERS.labels(site).set_function(lambda: self._live)
+
+    def _has_room(self):
+        """ This method is used to check that the pool and the limit allow one more driver, the lock being held """
+
+        return self._live < self.max_size and self.limit.live < self.limit.max_size
+
+    def _can_evict(self):
+        """ This method is used to check that only the limit keeps the pool from starting a driver another pool
+        could give up, the lock being held
+        """
+
+        return self._live < self.max_size and self.limit.has_idle(self)
+
+    def _reserve(self):
+        """ This method is used to count a driver about to be started, the lock being held """
+
+        self._live += 1
+        self.limit.live += 1
+
+    def _unreserve(self):
+        """ This method is used to free the slot of a driver quit or never started, the lock being held """
+
+        self._live -= 1
+        self.limit.live -= 1
+        self._condition.notify_all()
+
+    def _create(self):
+        """ This method is used to start a new driver """
+
+        print("[+ DriverPool +] Starting a new Firefox driver")
+        with DRIVER_STARTUP_SECONDS.labels(self.site).time():
+            return PooledDriver(self.factory(), self.factory, self.site)
+
+    @staticmethod
+    def _quit(driver):
+        """ This method is used to quit a driver ignoring the errors of dead sessions """
+
+        try:
+            driver.driver.quit()
+        except Exception as e:
+            print(f"[+ DriverPool +] Exception raised while quitting driver, {e}")
+
+    @staticmethod
+    def is_healthy(driver):
+        """ This method is used to check that the driver session still responds """
+
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self):
+        """ This method is used to pre-start the minimum number of drivers """
+
+        while True:
+            with self._condition:
+                if self._closed or self._live >= self.min_size or not self._has_room():
+                    return
+                self._reserve()
+            try:
+                driver = self._create()
+            except Exception as e:
+                print(f"[+ DriverPool +] Exception raised while warming up, {e}")
+                with self._condition:
+                    self._unreserve()
+                return
+            with self._condition:
+                self._idle.append(driver)
+                self._condition.notify_all()
+
+    def acquire(self):
+        """ This method is used to borrow a healthy driver from the pool """
+
+        while True:
+            evicted = None
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+                if not self._idle and not self._has_room() and self._can_evict():
+                    evicted = self.limit.evict(self)
+                if not self._idle and not self._has_room():
+                    if not self._condition.wait_for(
+                            lambda: self._idle or self._has_room() or self._can_evict() or self._closed,
+                            timeout=self.acquire_timeout):
+                        raise TimeoutError("Timed out waiting for a free driver")
+                    continue
+                if self._idle:
+                    driver = self._idle.pop()
+                else:
+                    self._reserve()
+                    driver = None
+
+            if evicted is not None:
+                print(f"[+ DriverPool +] Quitting an idle driver to start a {self.site} one")
+                self._quit(evicted)
+
+            if driver is None:
+                try:
+                    return self._create()
+                except Exception:
+                    with self._condition:
+                        self._unreserve()
+                    raise
+
+            if self.is_healthy(driver):
+                return driver
+
+            print("[+ DriverPool +] Discarding unhealthy driver")
+            self._discard(driver)
+
+    def release(self, driver, broken=False):
+        """ This method is used to return a driver to the pool, recycling it when worn out or broken """
+
+        if broken or self._closed or (self.max_pages and driver.pages >= self.max_pages):
+            self._discard(driver)
+            return
+
+        with self._condition:
+            self._idle.append(driver)
+            self._condition.notify_all()
+
+    def _discard(self, driver):
+        """ This method is used to quit a driver and free its slot """
+
+        self._quit(driver)
+        with self._condition:
+            self._unreserve()
+
+    @contextmanager
+    def driver(self):
+        """ This method is used to borrow a driver for the duration of a with block """
+
+        driver = self.acquire()
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = not self.is_healthy(driver)
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def close(self):
+        """ This method is used to quit every idle driver and refuse new checkouts """
+
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._live -= len(idle)
+            self.limit.live -= len(idle)
+            self._condition.notify_all()
+        for driver in idle:
+            self._quit(driver)
+
+    def stats(self):
+        """ This method is used to get the current pool occupancy """
+
+        with self._condition:
+            return {"live": self._live, "idle": len(self._idle), "in_use": self._live - len(self._idle)}
+
+
+driver_limit = DriverLimit()
+driver_pools = {site: DriverPool(factory=partial(get_firefox_driver, site),
+                                 min_size=DRIVER_POOL_MIN_SIZES.get(site, DRIVER_POOL_MIN_SIZES["default"]), site=site,
+                                 limit=driver_limit)
+                for site in SITES}
+
+
+def get_driver_pool(site):
+    """ This method is used to get the driver pool of the site """
+
+    return driver_pools[site]
@@ -1,31 +1,31 @@
-import requests
+import math
+import time
 import unicodedata
 
-from bs4 import BeautifulSoup as BS
 from fake_useragent import UserAgent
 from selenium_stealth import stealth
 import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
 
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from selenium.webdriver import Firefox
+from app.config import EBAY_RESULTS_PER_PAGE
+from app.helpers.blocking import BlockedError, detect_block, get_unblocked_page
+from app.helpers.budget import NO_BUDGET
+from app.helpers.driver_pool import get_driver_pool
+from app.helpers.fingerprints import fingerprint_store, get_sections_fingerprint
+from app.helpers.http_client import fetch, fetch_all
+from app.helpers.metrics import observe_page_fetch, timed_extractor, tracked_scrape
+from app.helpers.page_cache import page_cache
+from app.helpers.parser import get_soup
+from app.helpers.resource_policy import record_page_resources
+from app.helpers.result_store import stored_product
 
+driver_pool = get_driver_pool("ebay")
 
-def get_firefox_driver():
-    """ This method is used to get the Firefox driver """
-
-    options = FirefoxOptions()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--start-maximized')
-    options.add_argument('--disable-infobars')
-    options.add_argument('--disable-extensions')
-    options.add_argument('--disable-popup-blocking')
-    options.add_argument('--disable-dev-shm-usage')
-
-    driver = Firefox(options=options)
-
-    return driver
+FEEDBACK_PAGE_SIZE = 200
+NO_FEEDBACK_TEXT = "This member has not received any feedback comments."
+FINGERPRINT_SELECTORS = (".x-item-title__mainTitle", ".x-price-primary", ".d-quantity__availability",
+                         ".ux-layout-section-evo__item--table-view", "[selectboxlabel] option",
+                         ".ux-image-filmstrip-carousel img", ".x-sellercard-atf", ".fdbk-seller-rating__detailed-list",
+                         ".fdbk-detail-list")
 
 
 def get_random_user_agent():
@@ -65,17 +65,42 @@ def get_chrome_driver():
     return driver
 
 
-def get_page_source_code(url):
+def get_page_source_code(url, page_type=None):
     """ This method is used to get the page source code from the url """
 
-    header = {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.152 Safari/537.3"}
-    response = requests.get(url, headers=header)
+    response = fetch(url, page_type=page_type)
 
-    soup = BS(response.content, "html.parser")
+    soup = get_soup(response.content)
     return soup
 
 
+def get_page_source_codes(urls, page_type=None):
+    """ This method is used to get the page source code of many urls concurrently, None for a block page or a fetch
+    that failed or was paused by the circuit breaker
+    """
+
+    soups = []
+    for response in fetch_all(urls, page_type=page_type):
+        if response is None or detect_block("ebay", response):
+            soups.append(None)
+        else:
+            soups.append(get_soup(response.content))
+    return soups
+
+
+def get_description_url(product_id):
+    """ This method is used to get the item description url """
+
+    return f"https://vi.vipr.ebaydesc.com/ws/eBayISAPI.dll?ViewItemDescV4&item={product_id}"
+
+
+def get_product_id(product_url):
+    """ This method is used to get the item id from the product url """
+
+    return product_url.split("?")[0].split("/")[-1]
+
+
+@timed_extractor("ebay")
 def get_item_specification(soup):
     """ This method is used to get the specification of the items """
 
@@ -90,12 +115,13 @@ def get_item_specification(soup):
         return {}
 
 
-def get_item_description(product_id):
+@timed_extractor("ebay")
+def get_item_description(product_id, soup=None):
     """ This method is used to get the item description """
 
-    url = f"https://vi.vipr.ebaydesc.com/ws/eBayISAPI.dll?ViewItemDescV4&item={product_id}"
-    soup = get_page_source_code(url)
     try:
+        if soup is None:
+            soup = get_page_source_code(get_description_url(product_id), "description")
         description = soup.select("td")[-1].text.strip()
         if description:
             return description
@@ -108,12 +134,13 @@ def get_item_description(product_id):
         return "N/A"
 
 
+@timed_extractor("ebay")
 def get_product_images(soup):
     """ This method is used to get the product images """
 
     image_urls = []
     if images_tag := soup.select(".ux-image-filmstrip-carousel img"):
-        image_urls = {image.get("src").replace("l64.jpg", "l1600.jpg") for image in images_tag}
+        image_urls = dict.fromkeys(image.get("src").replace("l64.jpg", "l1600.jpg") for image in images_tag)
         return list(image_urls)
     else:
         buttons = soup.find_all('button', {'class': 'ux-image-grid-item'})
@@ -127,6 +154,7 @@ def get_product_images(soup):
     return image_urls
 
 
+@timed_extractor("ebay")
 def get_seller_username(soup):
     """ This method is used to get the seller username """
 
@@ -135,6 +163,7 @@ def get_seller_username(soup):
         return contact.get("href").split("&")[2].split("=")[-1]
 
 
+@timed_extractor("ebay")
 def get_seller_rating(soup):
     """ This method is used to get the seller ratings """
 
@@ -149,6 +178,7 @@ def get_seller_rating(soup):
     return None
 
 
+@timed_extractor("ebay")
 def get_stock(soup):
     """ This method is used to get the stock of the product """
 
@@ -159,6 +189,7 @@ def get_stock(soup):
         return "N/A"
 
 
+@timed_extractor("ebay")
 def get_title(soup):
     """ This method is used to get the title of the product """
 
@@ -169,6 +200,7 @@ def get_title(soup):
         return "N/A"
 
 
+@timed_extractor("ebay")
 def get_price(soup):
     """ This method is used to get the price of the product """
 
@@ -180,6 +212,7 @@ def get_price(soup):
         return "N/A"
 
 
+@timed_extractor("ebay")
 def get_color_variants(soup):
     """ This method is used to get the color variants """
 
@@ -192,6 +225,7 @@ def get_color_variants(soup):
     return []
 
 
+@timed_extractor("ebay")
 def get_size_variants(soup):
     """ This method is used to get the size variants """
 
@@ -203,8 +237,65 @@ def get_size_variants(soup):
     return []
 
 
-def get_reviews(driver, soup, seller_username, product_id, number_of_reviews):
-    """ This method is used to get the reviews the product """
+def get_feedback_url(seller_username, product_id, page_num):
+    """ This method is used to get the seller feedback url """
+
+    return f"https://www.ebay.com/fdbk/feedback_profile/{seller_username}?filter=feedback_page%3ARECEIVED_AS_SELLER&sort=TIME&page_id={page_num}&limit={FEEDBACK_PAGE_SIZE}&q={product_id}"
+
+
+def is_feedback_page(soup):
+    """ This method is used to check that the page holds feedback """
+
+    return bool(soup.select_one(".card__text")) or NO_FEEDBACK_TEXT in soup.get_text()
+
+
+def get_feedback_page_over_browser(driver, url, budget=NO_BUDGET):
+    """ This method is used to load a feedback page through the browser, None when it stays blocked
+
+    Without a driver, one is borrowed from the pool for this page only.
+    """
+
+    if driver is None:
+        with driver_pool.driver() as driver:
+            return get_feedback_page_over_browser(driver, url, budget)
+
+    started_at = time.perf_counter()
+    try:
+        get_unblocked_page(driver, url, "ebay", budget)
+    except BlockedError as e:
+        print(f"[+ Ebay +] {e}, giving up")
+        return None
+    observe_page_fetch("ebay", "feedback", "browser", time.perf_counter() - started_at)
+    record_page_resources(driver, "ebay", url)
+    return get_soup(driver.page_source)
+
+
+def get_feedback_pages(driver, urls, budget=NO_BUDGET):
+    """ This method is used to get feedback pages in order, concurrently over http with the browser as last resort """
+
+    soups = []
+    for url in urls:
+        page_source = page_cache.get(url, "feedback")
+        soups.append(get_soup(page_source) if page_source is not None else None)
+
+    missing = [i for i, soup in enumerate(soups) if soup is None]
+    for i, response in zip(missing, fetch_all([urls[i] for i in missing])):
+        if response is not None and not detect_block("ebay", response) and response.status_code == 200:
+            soup = get_soup(response.content)
+            if is_feedback_page(soup):
+                page_cache.put(urls[i], "feedback", response.content)
+                soups[i] = soup
+
+    for url, soup in zip(urls, soups):
+        if soup is None:
+            print(f"[+ Ebay +] Falling back to the browser for {url}")
+            soup = get_feedback_page_over_browser(driver, url, budget)
+        yield soup
+
+
+@timed_extractor("ebay")
+def get_reviews(driver, soup, seller_username, product_id, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to get the reviews the product, stopping when the budget runs out """
 
     feedback = soup.find('div', {'class': "fdbk-detail-list"})
     if not feedback:
@@ -217,44 +308,56 @@ def get_reviews(driver, soup, seller_username, product_id, number_of_reviews):
 
     reviews = comments.copy()
     page_num = 1
-    reviews_fetched = False
-
-    while not reviews_fetched:
-        url = f"https://www.ebay.com/fdbk/feedback_profile/{seller_username}?filter=feedback_page%3ARECEIVED_AS_SELLER&sort=TIME&page_id={page_num}&limit=200&q={product_id}"
-        driver.get(url)
-        if driver.title == "Security Measure":
-            driver.quit()
-            driver = get_firefox_driver()
-            print("[+ Ebay +] Getting chrome driver for scraping reviews...")
-            continue
-        else:
-            if "This member has not received any feedback comments." in driver.page_source:
+
+    while len(reviews) < number_of_reviews and not budget.expired():
+        number_of_pages = math.ceil((number_of_reviews - len(reviews)) / FEEDBACK_PAGE_SIZE)
+        urls = [get_feedback_url(seller_username, product_id, page_id)
+                for page_id in range(page_num, page_num + number_of_pages)]
+
+        for feedback_soup in get_feedback_pages(driver, urls, budget):
+            if budget.expired():
+                break
+            if feedback_soup is None:
+                return reviews[:number_of_reviews]
+            if NO_FEEDBACK_TEXT in feedback_soup.get_text():
                 return []
 
-            feedback_tag = driver.find_elements(By.CSS_SELECTOR, ".card__text")
-            for review in feedback_tag[3:]:
-                if len(reviews) >= number_of_reviews:
-                    reviews_fetched = True
-                    break
-                else:
-                    reviews.append(review.text.strip())
+            feedback_tag = feedback_soup.select(".card__text")
             if not feedback_tag:
-                reviews_fetched = True
-            page_num += 1
+                return reviews[:number_of_reviews]
+            reviews.extend(" ".join(review.get_text(" ").split()) for review in feedback_tag[3:])
+            if len(reviews) >= number_of_reviews:
+                break
+
+        page_num += number_of_pages
 
     return reviews[:number_of_reviews]
 
 
+@timed_extractor("ebay")
+def get_listing_links(soup):
+    """ This method is used to get the product links of a search page """
+
+    return [url.get("href") for url in soup.select(".clearfix > .s-item__pl-on-bottom .s-item__link")]
+
+
 def scrap_product_urls(keyword, number_of_products):
     """ This method is used to scrap the product urls """
 
     keyword = "+".join(keyword.split(" "))
-    page_num = 1
-    url = f"https://www.ebay.com/sch/i.html?_from=R40&_nkw={keyword}&_sacat=0&LH_TitleDesc=0&_pgn={page_num}"
-    soup = get_page_source_code(url)
-    if links_tag := soup.select(".clearfix > .s-item__pl-on-bottom .s-item__link"):
-        return [url.get("href") for url in links_tag][:number_of_products]
-    return None
+    number_of_pages = max(math.ceil(number_of_products / EBAY_RESULTS_PER_PAGE), 1)
+    urls = [f"https://www.ebay.com/sch/i.html?_from=R40&_nkw={keyword}&_sacat=0&LH_TitleDesc=0&_pgn={page_num}"
+            for page_num in range(1, number_of_pages + 1)]
+
+    product_links = []
+    for soup in get_page_source_codes(urls, "listing"):
+        if soup is None:
+            print(f"[+ Ebay +] Listing blocked for {keyword}")
+            break
+        if not (links := get_listing_links(soup)):
+            break
+        product_links.extend(links)
+    return product_links[:number_of_products] or None
 
 
 def clean_text(text):
@@ -267,12 +370,44 @@ def clean_text(text):
     return cleaned_text.strip()
 
 
-def scrap_product_data(driver, product_url, keyword, number_of_reviews):
-    """ This method is used to scrap the product data """
+def get_product_fingerprint(soup, description_soup=None):
+    """ This method is used to fingerprint the item sections, the seller feedback summary and the description """
+
+    description = " ".join(description_soup.get_text(" ").split()) if description_soup is not None else None
+    return get_sections_fingerprint(soup, FINGERPRINT_SELECTORS, description)
+
+
+def prefetch_product_pages(product_links):
+    """ This method is used to fetch the item and description pages of every product concurrently """
+
+    urls = []
+    for product_url in product_links:
+        urls.append(product_url)
+        urls.append(get_description_url(get_product_id(product_url)))
+    soups = get_page_source_codes(urls, ["product", "description"] * len(product_links))
+    return [(soups[i], soups[i + 1]) for i in range(0, len(soups), 2)]
+
+
+@stored_product("ebay")
+@timed_extractor("ebay")
+def scrap_product_data(driver, product_url, keyword, number_of_reviews, pages=None, budget=NO_BUDGET):
+    """ This method is used to scrap the product data, reusing the last record when the pages did not change """
 
     print(f"[+ Ebay +] Scraping data from: {product_url}")
 
-    soup = get_page_source_code(product_url)
+    product_id = get_product_id(product_url)
+    if pages is None:
+        pages = get_page_source_codes([product_url, get_description_url(product_id)], ["product", "description"])
+    soup, description_soup = pages
+    if soup is None:
+        print(f"[+ Ebay +] Product page blocked, skipping {product_url}")
+        return {"url": product_url, "SEARCH_KEYWORD": keyword, "error": f"ebay served a block page for {product_url}"}
+
+    fingerprint = get_product_fingerprint(soup, description_soup)
+    if product := fingerprint_store.get("ebay", product_url, fingerprint, number_of_reviews, keyword):
+        print(f"[+ Ebay +] Unchanged since the last scrape, reusing {product_url}")
+        return product
+
     title = get_title(soup)
     price = get_price(soup)
     stock = get_stock(soup)
@@ -283,10 +418,9 @@ def scrap_product_data(driver, product_url, keyword, number_of_reviews):
     seller_username = get_seller_username(soup)
 
     items_specific_details = get_item_specification(soup)
-    product_id = product_url.split("?")[0].split("/")[-1]
-    product_description = get_item_description(product_id)
+    product_description = get_item_description(product_id, description_soup)
     product_description = clean_text(product_description)
-    reviews = get_reviews(driver, soup, seller_username, product_id, number_of_reviews)
+    reviews = get_reviews(driver, soup, seller_username, product_id, number_of_reviews, budget)
 
     data = {
         "product_id": product_id,
@@ -303,27 +437,64 @@ def scrap_product_data(driver, product_url, keyword, number_of_reviews):
         "seller_ratings": seller_ratings,
         "reviews": reviews,
     }
-    return data
+    if budget.exhausted and len(reviews) < number_of_reviews:
+        data["partial"] = True
+    return fingerprint_store.put("ebay", product_url, fingerprint, number_of_reviews, data)
 
 
-def scrap_ebay(keyword, number_of_products, number_of_reviews):
-    """ This method is used to scrap ebay information """
+def get_product_links(keyword, number_of_products, budget=NO_BUDGET):
+    """ This method is used to get the product links of the keyword """
 
-    print(f"[+ Ebay +] Search Keyword: {keyword}")
+    if budget.expired():
+        return []
+    return scrap_product_urls(keyword, number_of_products) or []
+
+
+def scrap_product_with_pooled_driver(product_url, keyword, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to scrap one product over http, borrowing a driver only for the feedback fallback """
+
+    if budget.expired():
+        return {"url": product_url, "partial": True}
+    try:
+        return scrap_product_data(None, product_url, keyword, number_of_reviews, budget=budget)
+    except Exception as e:
+        print(f"[+ Ebay +] Exception raised for {product_url}, {e}")
+        return {"url": product_url, "error": str(e)}
+
+
+@tracked_scrape("ebay")
+def iter_ebay(keyword, number_of_products, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to scrap ebay yielding (position, total, product) as each product finishes
 
-    driver = get_firefox_driver()
+    No new product is started once the budget has run out. Everything is fetched over http, a driver being borrowed
+    only for the feedback pages falling back to the browser.
+    """
 
-    product_links = scrap_product_urls(keyword, number_of_products)
+    print(f"[+ Ebay +] Search Keyword: {keyword}")
+
+    product_links = get_product_links(keyword, number_of_products, budget)
     print(f"[+ Ebay +] Product Link is found for {keyword}")
     print(f"[+ Ebay +] Links: {product_links}")
 
-    data = []
     if product_links:
-        for link in product_links:
-            product_details = scrap_product_data(driver, link, keyword, number_of_reviews)
-            data.append(product_details)
+        product_pages = prefetch_product_pages(product_links)
+        for position, (link, pages) in enumerate(zip(product_links, product_pages)):
+            if budget.expired():
+                print(f"[+ Ebay +] Time budget exhausted for {keyword}")
+                break
+            product_details = scrap_product_data(None, link, keyword, number_of_reviews, pages, budget)
+            yield position, len(product_links), product_details
     else:
         print("[+ Ebay +] Unable to fetch product links")
 
-    driver.quit()
+
+def scrap_ebay(keyword, number_of_products, number_of_reviews, progress_callback=None, budget=NO_BUDGET):
+    """ This method is used to scrap ebay information """
+
+    data = []
+    for position, total, product_details in iter_ebay(keyword, number_of_products, number_of_reviews, budget):
+        data.append(product_details)
+        if progress_callback:
+            progress_callback(len(data), total)
+
     return data
@@ -0,0 +1,89 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from app.config import FANOUT_WORKERS, FANOUT_DEADLINES
+from app.helpers.budget import TimeBudget
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fan-out")
+
+
+def get_deadline(site, deadline=None):
+    """ This method is used to get the deadline of a site in seconds, the requested one taking precedence """
+
+    if deadline is not None:
+        return deadline
+    return FANOUT_DEADLINES.get(site, FANOUT_DEADLINES["default"])
+
+
+def collect_products(state, products):
+    """ This method is used to consume a (position, total, product) iterator until it ends or the site is stopped """
+
+    try:
+        if state["stopped"].is_set():
+            return
+        for position, total, product in products:
+            with state["lock"]:
+                state["products"].append(product)
+                state["total"] = total
+            if state["stopped"].is_set():
+                break
+        else:
+            state["status"] = "partial" if state["budget"].exhausted else "complete"
+    except Exception as e:
+        print(f"[+ FanOut +] Exception raised while scraping {state['site']}, {e}")
+        state["error"] = str(e)
+        state["status"] = "failed"
+    finally:
+        products.close()
+        state["finished_at"] = time.time()
+
+
+def fan_out(streamers, keyword, number_of_products, number_of_reviews, deadline=None, time_budget=None):
+    """ This method is used to scrape the keyword on every site concurrently, each within its own deadline
+
+    The deadline, capped by the time budget of the request, is also the time budget of the site's scrape, so its
+    stages stop fetching when it runs out. A site still running at its deadline is reported as partial with the
+    products it finished.
+    """
+
+    started_at = time.time()
+    states, futures = {}, {}
+    for site, streamer in streamers.items():
+        site_deadline = get_deadline(site, deadline)
+        budget = TimeBudget(min(site_deadline, time_budget) if time_budget is not None else site_deadline)
+        states[site] = {"site": site, "status": "partial", "products": [], "total": None, "error": None,
+                        "finished_at": None, "lock": threading.Lock(), "stopped": threading.Event(),
+                        "budget": budget, "deadline_at": started_at + budget.seconds}
+        futures[site] = _executor.submit(collect_products, states[site],
+                                         streamer(keyword, number_of_products, number_of_reviews, budget=budget))
+
+    results = {}
+    for site in sorted(states, key=lambda site: states[site]["deadline_at"]):
+        state = states[site]
+        try:
+            futures[site].result(timeout=max(state["deadline_at"] - time.time(), 0))
+        except TimeoutError:
+            state["stopped"].set()
+            print(f"[+ FanOut +] Deadline hit for {site}, returning partial results")
+
+        with state["lock"]:
+            results[site] = {"status": state["status"], "count": len(state["products"]), "total": state["total"],
+                             "elapsed": round((state["finished_at"] or time.time()) - started_at, 3),
+                             "error": state["error"],
+                             "products": list(state["products"])}
+
+    results = {site: results[site] for site in streamers}
+    return {
+        "keyword": keyword,
+        "elapsed": round(time.time() - started_at, 3),
+        "sites": {site: {k: v for k, v in result.items() if k != "products"} for site, result in results.items()},
+        "products": [{"site": site, **product} for site, result in results.items() for product in result["products"]
+                     if product],
+    }
+
+
+def shutdown():
+    """ This method is used to stop accepting fan-outs """
+
+    _executor.shutdown(wait=False, cancel_futures=True)
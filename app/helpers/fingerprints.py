@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from app.config import FINGERPRINT_ENABLED, FINGERPRINT_PATH, FINGERPRINT_MAX_AGE
+from app.helpers.metrics import FINGERPRINT_LOOKUPS
+from app.helpers.page_cache import normalize_url
+
+
+def get_fingerprint(*parts):
+    """ This method is used to hash json encodable parts into a fingerprint """
+
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get_sections_fingerprint(soup, selectors, *parts):
+    """ This method is used to fingerprint the text and image sources of the sections matched by the selectors
+
+    Only what the extractors read is hashed, so the tokens and tracking attributes changing on every load of a page
+    leave the fingerprint alone.
+    """
+
+    sections = []
+    for selector in selectors:
+        for tag in soup.select(selector):
+            sections.append(" ".join(tag.get_text(" ").split()))
+            images = [tag] if tag.name == "img" else tag.select("img")
+            sections.extend(image.get("src") for image in images if image.get("src"))
+    return get_fingerprint(sections, *parts)
+
+
+class FingerprintStore:
+    """ Last complete record of every product with the fingerprint of the pages it was extracted from
+
+    A product whose fingerprint did not change since its last scrape is served from here, skipping its extraction
+    and review crawl. Records older than max_age are scraped again regardless, to pick up what the fingerprint
+    does not cover.
+    """
+
+    def __init__(self, path=FINGERPRINT_PATH, max_age=FINGERPRINT_MAX_AGE, enabled=FINGERPRINT_ENABLED):
+        self.path = path
+        self.max_age = max_age
+        self.enabled = enabled
+
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """ This method is used to open the fingerprint database on first use """
+
+        if self._connection is None:
+            if directory := os.path.dirname(self.path):
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS products (
+                    key TEXT PRIMARY KEY,
+                    site TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    number_of_reviews INTEGER NOT NULL,
+                    scraped_at REAL NOT NULL,
+                    checked_at REAL NOT NULL,
+                    record BLOB NOT NULL
+                )""")
+            self._connection = connection
+        return self._connection
+
+    def get(self, site, url, fingerprint, number_of_reviews, keyword):
+        """ This method is used to get the stored record of an unchanged product with a fresh checked_at
+
+        None when the product is new or changed, when its record is too old or when it was scraped for fewer
+        reviews than asked.
+        """
+
+        if not self.enabled or fingerprint is None:
+            return None
+
+        key = f"{site}:{normalize_url(url)}"
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT fingerprint, number_of_reviews, scraped_at, record FROM products WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                result = "new"
+            elif row[0] != fingerprint or row[1] < number_of_reviews or now - row[2] > self.max_age:
+                result = "changed"
+            else:
+                result = "unchanged"
+                connection.execute("UPDATE products SET checked_at = ? WHERE key = ?", (now, key))
+                connection.commit()
+        FINGERPRINT_LOOKUPS.labels(site, result).inc()
+        if result != "unchanged":
+            return None
+
+        record = json.loads(zlib.decompress(row[3]))
+        if isinstance(record.get("reviews"), list):
+            record["reviews"] = record["reviews"][:number_of_reviews]
+        record["SEARCH_KEYWORD"] = keyword
+        record["checked_at"] = now
+        return record
+
+    def put(self, site, url, fingerprint, number_of_reviews, record):
+        """ This method is used to store a freshly scraped record and return it with its checked_at
+
+        Partial or failed records and records without a fingerprint are returned without being stored.
+        """
+
+        now = time.time()
+        record["checked_at"] = now
+        if not self.enabled or fingerprint is None or record.get("partial") or record.get("error"):
+            return record
+
+        body = zlib.compress(json.dumps(record).encode("utf-8"), 6)
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (f"{site}:{normalize_url(url)}", site, fingerprint, number_of_reviews, now, now, body))
+            connection.commit()
+        return record
+
+
+fingerprint_store = FingerprintStore()
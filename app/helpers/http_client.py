@@ -0,0 +1,125 @@
+import time
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from app.config import HTTP_POOL_HOSTS, HTTP_PER_HOST_CONNECTIONS, HTTP_CONCURRENCY, HTTP_TIMEOUT
+from app.helpers.metrics import get_site, observe_page_fetch
+from app.helpers.page_cache import page_cache
+from app.helpers.blocking import BlockedError, classify_response, get_circuit_breaker
+from app.helpers.rate_limiter import get_outcome, rate_limiter
+from app.helpers.replay import record_response, rewrite_url
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.152 Safari/537.3",
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Connection": "keep-alive",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """ This method is used to get the shared keep-alive session """
+
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_PER_HOST_CONNECTIONS,
+                                      pool_block=True)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(DEFAULT_HEADERS)
+                _session = session
+    return _session
+
+
+def get_cached_response(url, content):
+    """ This method is used to wrap a cached page into a response """
+
+    response = requests.Response()
+    response._content = content
+    response.status_code = 200
+    response.url = url
+    response.encoding = "utf-8"
+    response.from_cache = True
+    return response
+
+
+def fetch(url, headers=None, timeout=HTTP_TIMEOUT, page_type=None, cache=True):
+    """ This method is used to fetch the url over the pooled session, cached when a page type is given
+
+    Network fetches wait on the rate limiter of the site and report whether they were blocked or throttled; block
+    pages are neither cached nor archived. Raises BlockedError without sending anything while the circuit breaker
+    of the site is open. Callers validating the page before caching it themselves pass cache=False; page_type then
+    only labels metrics.
+    """
+
+    started_at = time.perf_counter()
+    cache = cache and page_type
+    if cache and (content := page_cache.get(url, page_type)) is not None:
+        observe_page_fetch(get_site(url), page_type, "cache", time.perf_counter() - started_at)
+        return get_cached_response(url, content)
+
+    site = get_site(url)
+    if get_circuit_breaker(site).is_open():
+        raise BlockedError(site, None, "paused by its circuit breaker")
+
+    with rate_limiter.limit(url) as permit:
+        response = get_session().get(rewrite_url(url), headers=headers, timeout=timeout)
+        reason = classify_response(response)
+        permit.outcome = get_outcome(reason)
+    response.from_cache = False
+    if not reason:
+        record_response(url, response)
+    observe_page_fetch(site, page_type, "http", time.perf_counter() - started_at)
+    if cache and response.status_code == 200 and not reason:
+        page_cache.put(url, page_type, response.content)
+    return response
+
+
+async def fetch_async(url, headers=None, timeout=HTTP_TIMEOUT, page_type=None, cache=True):
+    """ This method is used to fetch the url without blocking the event loop """
+
+    return await asyncio.to_thread(fetch, url, headers, timeout, page_type, cache)
+
+
+async def _gather(urls, headers, concurrency, per_host, page_types, cache):
+    """ This method is used to fetch the urls concurrently keeping their order """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    host_semaphores = {}
+
+    async def bounded_fetch(url, page_type):
+        host = urlsplit(url).netloc
+        host_semaphore = host_semaphores.setdefault(host, asyncio.Semaphore(per_host))
+        async with semaphore, host_semaphore:
+            try:
+                return await fetch_async(url, headers, page_type=page_type, cache=cache)
+            except (requests.RequestException, BlockedError) as e:
+                print(f"[+ HTTP +] Exception raised fetching {url}, {e}")
+                return None
+
+    return await asyncio.gather(*(bounded_fetch(url, page_type) for url, page_type in zip(urls, page_types)))
+
+
+def fetch_all(urls, headers=None, concurrency=HTTP_CONCURRENCY, per_host=HTTP_PER_HOST_CONNECTIONS, page_type=None,
+              cache=True):
+    """ This method is used to fetch many urls with bounded concurrency, None marks a failed or paused url
+
+    page_type is either one page type for every url or a list holding the page type of each url.
+    """
+
+    urls = list(urls)
+    if not urls:
+        return []
+    page_types = list(page_type) if isinstance(page_type, (list, tuple)) else [page_type] * len(urls)
+    return asyncio.run(_gather(urls, headers, concurrency, per_host, page_types, cache))
@@ -0,0 +1,93 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import JOB_WORKERS, JOB_HISTORY_SIZE
+from app.helpers.budget import TimeBudget
+
+
+class JobManager:
+    """ Queue of scrape jobs executed in the background """
+
+    def __init__(self, workers=JOB_WORKERS, history_size=JOB_HISTORY_SIZE):
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scrape-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, site, scraper, keyword, number_of_products, number_of_reviews, time_budget=None):
+        """ This method is used to queue a scrape and return its job id
+
+        The time budget in seconds starts when the job starts running, not while it is queued.
+        """
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "site": site,
+            "keyword": keyword,
+            "status": "queued",
+            "progress": {"done": 0, "total": number_of_products},
+            "time_budget": time_budget,
+            "partial": False,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "result": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._trim()
+
+        self._executor.submit(self._run, job, scraper, keyword, number_of_products, number_of_reviews, time_budget)
+        return job_id
+
+    def _run(self, job, scraper, keyword, number_of_products, number_of_reviews, time_budget=None):
+        """ This method is used to execute a queued job """
+
+        def progress_callback(done, total):
+            job["progress"] = {"done": done, "total": total}
+
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        budget = TimeBudget(time_budget)
+        try:
+            job["result"] = scraper(keyword, number_of_products, number_of_reviews,
+                                    progress_callback=progress_callback, budget=budget)
+            job["partial"] = budget.exhausted
+            job["status"] = "finished"
+        except Exception as e:
+            print(f"[+ Jobs +] Exception raised in job {job['job_id']}, {e}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+        job["finished_at"] = time.time()
+
+    def _trim(self):
+        """ This method is used to forget the oldest completed jobs """
+
+        completed = [job_id for job_id, job in self._jobs.items() if job["status"] in ("finished", "failed")]
+        for job_id in completed[:max(len(self._jobs) - self.history_size, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """ This method is used to get a job by id """
+
+        return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        """ This method is used to get the job status without its result """
+
+        if job := self.get(job_id):
+            return {k: v for k, v in job.items() if k != "result"}
+        return None
+
+    def shutdown(self):
+        """ This method is used to stop accepting jobs """
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager()
@@ -0,0 +1,92 @@
+import time
+from functools import wraps
+from urllib.parse import urlsplit
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LONG_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+DRIVER_STARTUP_SECONDS = Histogram(
+    "scraper_driver_startup_seconds", "Time to launch a browser driver", ["site"], buckets=LATENCY_BUCKETS)
+PAGE_FETCH_SECONDS = Histogram(
+    "scraper_page_fetch_seconds", "Time to fetch a page", ["site", "page_type", "path"], buckets=LATENCY_BUCKETS)
+HTML_PARSE_SECONDS = Histogram(
+    "scraper_html_parse_seconds", "Time to parse a page", ["backend"], buckets=LATENCY_BUCKETS)
+EXTRACTOR_SECONDS = Histogram(
+    "scraper_extractor_seconds", "Time spent in a named extractor", ["site", "extractor"], buckets=LATENCY_BUCKETS)
+WAIT_SECONDS = Histogram(
+    "scraper_wait_seconds", "Time spent in a browser wait", ["name", "timed_out"], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    "scraper_request_seconds", "End-to-end API request time", ["method", "route", "status"],
+    buckets=LONG_LATENCY_BUCKETS)
+
+BLOCK_PAGES = Counter("scraper_block_pages_total", "Block or captcha pages detected", ["site", "path"])
+PAGE_CACHE_LOOKUPS = Counter("scraper_page_cache_lookups_total", "Page cache lookups", ["page_type", "result"])
+FINGERPRINT_LOOKUPS = Counter("scraper_fingerprint_lookups_total", "Product fingerprint lookups", ["site", "result"])
+
+SCRAPES_IN_FLIGHT = Gauge("scraper_scrapes_in_flight", "Scrapes currently running", ["site"])
+LIVE_DRIVERS = Gauge("scraper_live_drivers", "Browser drivers currently alive", ["site"])
+RATE_LIMIT_RATE = Gauge("scraper_rate_limit_rate", "Requests per second allowed by the rate limiter", ["site"])
+RATE_LIMIT_CONCURRENCY = Gauge(
+    "scraper_rate_limit_concurrency", "Concurrent requests allowed by the rate limiter", ["site"])
+CIRCUIT_OPEN = Gauge("scraper_circuit_open", "Whether the circuit breaker of the site is open", ["site"])
+
+SITE_HOSTS = (("amazon.", "amazon"), ("ebay", "ebay"), ("walmart.", "walmart"))
+
+
+def get_site(url):
+    """ This method is used to get the site label of a url """
+
+    host = urlsplit(url).netloc.lower()
+    for fragment, site in SITE_HOSTS:
+        if fragment in host:
+            return site
+    return "other"
+
+
+def observe_page_fetch(site, page_type, path, seconds):
+    """ This method is used to record the time taken to fetch a page """
+
+    PAGE_FETCH_SECONDS.labels(site, page_type or "other", path).observe(seconds)
+
+
+def record_block_page(site, path):
+    """ This method is used to count a detected block page """
+
+    BLOCK_PAGES.labels(site, path).inc()
+
+
+def timed_extractor(site):
+    """ This method is used to decorate an extractor so its latency is recorded under its name """
+
+    def decorator(function):
+        histogram = EXTRACTOR_SECONDS.labels(site, function.__name__)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started_at)
+
+        return wrapper
+
+    return decorator
+
+
+def tracked_scrape(site):
+    """ This method is used to decorate a scrape generator so it counts as in flight until it finishes """
+
+    def decorator(function):
+        gauge = SCRAPES_IN_FLIGHT.labels(site)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with gauge.track_inprogress():
+                yield from function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
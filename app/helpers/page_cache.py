@@ -0,0 +1,160 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from app.config import PAGE_CACHE_ENABLED, PAGE_CACHE_PATH, PAGE_CACHE_MAX_BYTES, PAGE_CACHE_TTLS
+from app.helpers.metrics import PAGE_CACHE_LOOKUPS
+
+TRACKING_PARAMS = {"ref", "ref_", "_trksid", "_trkparms", "hash", "amdata", "athbdg", "from", "sr", "qid", "crid",
+                   "sprefix", "pd_rd_w", "pd_rd_r", "pd_rd_wg", "pd_rd_i", "pf_rd_p", "pf_rd_r", "content-id",
+                   "classType", "adsRedirect", "athcpid", "athpgid", "athznid", "athmtid", "athena"}
+
+
+def normalize_url(url):
+    """ This method is used to normalize the url into a cache key """
+
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key not in TRACKING_PARAMS)
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+class PageCache:
+    """ Size-bounded LRU cache of compressed pages stored on disk """
+
+    def __init__(self, path=PAGE_CACHE_PATH, max_bytes=PAGE_CACHE_MAX_BYTES, ttls=PAGE_CACHE_TTLS,
+                 enabled=PAGE_CACHE_ENABLED):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.enabled = enabled
+
+        self._connection = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "expired": 0, "writes": 0})
+        self._evictions = 0
+
+    def _connect(self):
+        """ This method is used to open the cache database on first use """
+
+        if self._connection is None:
+            if directory := os.path.dirname(self.path):
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    key TEXT PRIMARY KEY,
+                    page_type TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    body BLOB NOT NULL
+                )""")
+            connection.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+            self._total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            self._connection = connection
+        return self._connection
+
+    def ttl(self, page_type):
+        """ This method is used to get the time to live of a page type """
+
+        return self.ttls.get(page_type, self.ttls["default"])
+
+    def get(self, url, page_type):
+        """ This method is used to get a fresh cached page as bytes, None on a miss """
+
+        if not self.enabled:
+            return None
+
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT fetched_at, size, body FROM pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats[page_type]["misses"] += 1
+                PAGE_CACHE_LOOKUPS.labels(page_type, "miss").inc()
+                return None
+
+            fetched_at, size, body = row
+            if now - fetched_at > self.ttl(page_type):
+                connection.execute("DELETE FROM pages WHERE key = ?", (key,))
+                connection.commit()
+                self._total_bytes -= size
+                self._stats[page_type]["expired"] += 1
+                self._stats[page_type]["misses"] += 1
+                PAGE_CACHE_LOOKUPS.labels(page_type, "expired").inc()
+                return None
+
+            connection.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (now, key))
+            connection.commit()
+            self._stats[page_type]["hits"] += 1
+            PAGE_CACHE_LOOKUPS.labels(page_type, "hit").inc()
+        return zlib.decompress(body)
+
+    def put(self, url, page_type, page_source):
+        """ This method is used to store a page in the cache """
+
+        if not self.enabled or not page_source:
+            return
+
+        if isinstance(page_source, str):
+            page_source = page_source.encode("utf-8")
+        body = zlib.compress(page_source, 6)
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            if row := connection.execute("SELECT size FROM pages WHERE key = ?", (key,)).fetchone():
+                self._total_bytes -= row[0]
+            connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, page_type, now, now, len(body), body))
+            self._total_bytes += len(body)
+            self._stats[page_type]["writes"] += 1
+            self._evict(connection)
+            connection.commit()
+
+    def _evict(self, connection):
+        """ This method is used to drop the least recently used pages until the cache fits its budget """
+
+        while self._total_bytes > self.max_bytes:
+            rows = connection.execute("SELECT key, size FROM pages ORDER BY accessed_at LIMIT 50").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                connection.execute("DELETE FROM pages WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self._evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    return
+
+    def stats(self):
+        """ This method is used to get the hit and miss statistics of the cache """
+
+        with self._lock:
+            by_page_type = {page_type: dict(stats) for page_type, stats in self._stats.items()}
+            hits = sum(stats["hits"] for stats in by_page_type.values())
+            misses = sum(stats["misses"] for stats in by_page_type.values())
+            return {
+                "enabled": self.enabled,
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                "evictions": self._evictions,
+                "bytes": self._total_bytes,
+                "by_page_type": by_page_type,
+            }
+
+
+page_cache = PageCache()
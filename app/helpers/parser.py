@@ -0,0 +1,140 @@
+from bs4 import BeautifulSoup
+
+from app.config import HTML_PARSER_BACKEND
+from app.helpers.metrics import HTML_PARSE_SECONDS
+
+BACKENDS = ("html.parser", "lxml", "lexbor")
+# text BeautifulSoup leaves out of get_text, and text whose whitespace it keeps as is
+NON_TEXT_TAGS = ("script", "style", "template")
+PRESERVE_WHITESPACE_TAGS = ("pre", "textarea")
+
+
+def get_soup(page_source, backend=None):
+    """ This method is used to parse the page source with the configured parser backend """
+
+    backend = backend or HTML_PARSER_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    with HTML_PARSE_SECONDS.labels(backend).time():
+        if backend == "lexbor":
+            return get_lexbor_soup(page_source)
+        return BeautifulSoup(page_source, backend)
+
+
+def get_lexbor_soup(page_source):
+    """ This method is used to parse the page source with selectolax's lexbor engine """
+
+    try:
+        from selectolax.lexbor import LexborHTMLParser
+    except ImportError as e:
+        raise RuntimeError("The lexbor parser backend requires the selectolax package") from e
+
+    return LexborNode(LexborHTMLParser(page_source or "").root)
+
+
+def build_selector(name=None, attrs=None, **kwargs):
+    """ This method is used to translate BeautifulSoup find arguments into a css selector """
+
+    attrs = dict(attrs or {}, **kwargs)
+    selector = name or ""
+    for key, value in attrs.items():
+        if value is True:
+            selector += f"[{key}]"
+        elif key == "class" and " " not in value:
+            selector += f".{value}"
+        else:
+            value = str(value).replace('"', '\\"')
+            selector += f'[{key}="{value}"]'
+    return selector or "*"
+
+
+class LexborNode:
+    """ Adapter exposing the BeautifulSoup methods the scrapers use on top of a selectolax node """
+
+    def __init__(self, node):
+        self.node = node
+
+    @classmethod
+    def wrap(cls, node):
+        return cls(node) if node is not None else None
+
+    def __bool__(self):
+        return True
+
+    def __getitem__(self, key):
+        return self.node.attributes[key]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.find(name)
+
+    @property
+    def name(self):
+        return self.node.tag
+
+    @property
+    def attrs(self):
+        return self.node.attributes
+
+    @property
+    def parent(self):
+        return self.wrap(self.node.parent)
+
+    @property
+    def text(self):
+        return self.get_text()
+
+    @staticmethod
+    def preserves_whitespace(node):
+        while node is not None:
+            if node.tag in PRESERVE_WHITESPACE_TAGS:
+                return True
+            node = node.parent
+        return False
+
+    def strings(self):
+        """ This method is used to get the text nodes as BeautifulSoup keeps them, whitespace-only text collapsed to a
+        single newline or space and script or style text left out
+        """
+
+        for node in self.node.traverse(include_text=True):
+            if node.tag != "-text" or node.parent.tag in NON_TEXT_TAGS:
+                continue
+            text = node.text_content
+            if not text.strip() and not self.preserves_whitespace(node):
+                text = "\n" if "\n" in text else " "
+            yield text
+
+    def get_text(self, separator="", strip=False):
+        strings = self.strings()
+        if strip:
+            strings = (text.strip() for text in strings)
+            strings = (text for text in strings if text)
+        return separator.join(strings)
+
+    def get(self, key, default=None):
+        value = self.node.attributes.get(key, default)
+        return default if value is None else value
+
+    def select(self, selector, namespaces=None):
+        """ This method is used to get the matching nodes once each, in document order
+
+        lexbor yields a node once per ancestor path matching a descendant selector, so nested ancestors repeat it.
+        """
+
+        nodes = self.node.css(selector)
+        unique = list({node.mem_id: node for node in nodes}.values())
+        if len(unique) < len(nodes):
+            order = {node.mem_id: position for position, node in enumerate(self.node.traverse())}
+            unique.sort(key=lambda node: order[node.mem_id])
+        return [LexborNode(node) for node in unique]
+
+    def select_one(self, selector, namespaces=None):
+        return self.wrap(self.node.css_first(selector))
+
+    def find(self, name=None, attrs=None, **kwargs):
+        return self.select_one(build_selector(name, attrs, **kwargs))
+
+    def find_all(self, name=None, attrs=None, **kwargs):
+        return self.select(build_selector(name, attrs, **kwargs))
@@ -0,0 +1,159 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from app.config import RATE_LIMITS, RATE_LIMIT_INCREASE, RATE_LIMIT_DECREASE, RATE_LIMIT_COOLDOWN
+from app.helpers.metrics import RATE_LIMIT_CONCURRENCY, RATE_LIMIT_RATE, get_site
+
+OK = "ok"
+ERROR = "error"
+BLOCKED = "blocked"
+# also the reason the block detection gives to 429 and 503 responses
+THROTTLED = "throttled"
+
+
+def get_outcome(reason):
+    """ This method is used to get the rate limiter outcome of a page classified by the block detection """
+
+    if not reason:
+        return OK
+    return THROTTLED if reason == THROTTLED else BLOCKED
+
+
+class DomainLimiter:
+    """ Token bucket with an adaptive rate and concurrency for one site
+
+    Successes add RATE_LIMIT_INCREASE requests per second to the rate and, once per window of as many
+    successes as the current concurrency, one more concurrent request. Block pages and throttling halve both
+    and freeze increases for the cooldown.
+    """
+
+    def __init__(self, site, rate, min_rate, max_rate, concurrency, max_concurrency, increase=RATE_LIMIT_INCREASE,
+                 decrease=RATE_LIMIT_DECREASE, cooldown=RATE_LIMIT_COOLDOWN):
+        self.site = site
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self._tokens = 1.0
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._successes = 0
+        self._frozen_until = 0.0
+        self._counts = {OK: 0, ERROR: 0, BLOCKED: 0, THROTTLED: 0}
+        self._condition = threading.Condition()
+        self._publish()
+
+    def _refill(self, now):
+        """ This method is used to add the tokens earned since the last refill, the lock being held """
+
+        self._tokens = min(self._tokens + (now - self._refilled_at) * self.rate, max(self.rate, 1.0))
+        self._refilled_at = now
+
+    def acquire(self):
+        """ This method is used to wait for a free slot and a token """
+
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._in_flight < self.concurrency and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+                if self._in_flight >= self.concurrency:
+                    self._condition.wait()
+                else:
+                    self._condition.wait((1 - self._tokens) / self.rate)
+
+    def release(self, outcome):
+        """ This method is used to free the slot and adapt the limits to the outcome of the request """
+
+        with self._condition:
+            self._in_flight -= 1
+            self._counts[outcome] += 1
+            now = time.monotonic()
+            if outcome in (BLOCKED, THROTTLED):
+                self._back_off(now)
+            elif outcome == OK and now >= self._frozen_until:
+                self.rate = min(self.rate + self.increase, self.max_rate)
+                self._successes += 1
+                if self._successes >= self.concurrency:
+                    self._successes = 0
+                    self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+            self._publish()
+            self._condition.notify_all()
+
+    def _back_off(self, now):
+        """ This method is used to cut the limits multiplicatively, once per cooldown, the lock being held """
+
+        if now < self._frozen_until:
+            return
+        print(f"[+ RateLimiter +] Backing off {self.site}")
+        self.rate = max(self.rate * self.decrease, self.min_rate)
+        self.concurrency = max(int(self.concurrency * self.decrease), 1)
+        self._tokens = min(self._tokens, 0.0)
+        self._successes = 0
+        self._frozen_until = now + self.cooldown
+
+    def _publish(self):
+        RATE_LIMIT_RATE.labels(self.site).set(self.rate)
+        RATE_LIMIT_CONCURRENCY.labels(self.site).set(self.concurrency)
+
+    def stats(self):
+        with self._condition:
+            return {"rate": round(self.rate, 3), "concurrency": self.concurrency, "in_flight": self._in_flight,
+                    "cooling_down": time.monotonic() < self._frozen_until, "outcomes": dict(self._counts)}
+
+
+class Permit:
+    """ Outcome holder handed to the caller of a rate limited request """
+
+    def __init__(self):
+        self.outcome = OK
+
+
+class RateLimiter:
+    """ Process-wide registry of the per-site limiters consulted by every fetch path """
+
+    def __init__(self, limits=RATE_LIMITS):
+        self.limits = limits
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get_limiter(self, url):
+        """ This method is used to get the limiter of the site of the url """
+
+        site = get_site(url)
+        with self._lock:
+            if site not in self._limiters:
+                self._limiters[site] = DomainLimiter(site, **(self.limits.get(site) or self.limits["default"]))
+            return self._limiters[site]
+
+    @contextmanager
+    def limit(self, url):
+        """ This method is used to wait for the right to request the url, reporting the outcome set on the permit """
+
+        limiter = self.get_limiter(url)
+        limiter.acquire()
+        permit = Permit()
+        try:
+            yield permit
+        except Exception:
+            permit.outcome = ERROR
+            raise
+        finally:
+            limiter.release(permit.outcome)
+
+    def stats(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {site: limiter.stats() for site, limiter in limiters.items()}
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,272 @@
+""" Record the pages fetched by the scrapers and replay them from a local server.
+
+Record: set ARCHIVE_MODE = "record" and run the scrapers; every response fetched over http or loaded in the
+browser is stored in the archive by url.
+
+Replay: start the server and set ARCHIVE_MODE = "replay"; every url is then rewritten to the server, and the
+browser uses the server as its proxy so the subresources of the replayed pages never reach the live sites: plain
+http requests are served from the archive and https tunnels are refused.
+Pages served from the page cache never reach the server, so disable it for runs timing the fetches.
+
+    python -m app.helpers.replay [--archive PATH] [--port N] [--latency S] [--jitter S] [--block-rate P]
+"""
+import os
+import sys
+import time
+import zlib
+import random
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlsplit
+
+from app.config import ARCHIVE_MODE, ARCHIVE_PATH, REPLAY_HOST, REPLAY_PORT
+from app.helpers.metrics import get_site
+from app.helpers.page_cache import normalize_url
+
+REPLAY_URL = f"http://{REPLAY_HOST}:{REPLAY_PORT}"
+
+BLOCK_PAGES = {
+    "amazon": (200, "<html><head><title>Amazon.com</title></head><body>"
+                    "<form action='/errors/validateCaptcha'><input name='field-keywords'></form></body></html>"),
+    "ebay": (200, "<html><head><title>Security Measure</title></head><body></body></html>"),
+    "walmart": (200, "<html><head><title>Robot or human?</title></head><body></body></html>"),
+}
+
+
+class Archive:
+    """ Compressed responses stored on disk by normalized url """
+
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """ This method is used to open the archive database on first use """
+
+        if self._connection is None:
+            if directory := os.path.dirname(self.path):
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    content_type TEXT,
+                    location TEXT,
+                    recorded_at REAL NOT NULL,
+                    body BLOB NOT NULL
+                )""")
+            self._connection = connection
+        return self._connection
+
+    def record(self, url, status, body, content_type=None, final_url=None):
+        """ This method is used to store a response; a redirect is stored as one entry per url """
+
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        body = body or b""
+        entries = [(url, status, body, None)]
+        if final_url and normalize_url(final_url) != normalize_url(url):
+            entries = [(url, 302, b"", final_url), (final_url, status, body, None)]
+
+        with self._lock:
+            connection = self._connect()
+            for entry_url, entry_status, entry_body, location in entries:
+                connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (normalize_url(entry_url), entry_url, entry_status, content_type, location,
+                                    time.time(), zlib.compress(entry_body, 6)))
+            connection.commit()
+
+    def get(self, url):
+        """ This method is used to get a recorded response as a dict, None when the url was never recorded """
+
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT url, status, content_type, location, body FROM responses WHERE key = ?",
+                (normalize_url(url),)).fetchone()
+        if row is None:
+            return None
+        url, status, content_type, location, body = row
+        return {"url": url, "status": status, "content_type": content_type, "location": location,
+                "body": zlib.decompress(body)}
+
+    def hosts(self):
+        """ This method is used to get the hosts present in the archive """
+
+        with self._lock:
+            rows = self._connect().execute("SELECT DISTINCT url FROM responses").fetchall()
+        return sorted({urlsplit(url).netloc for url, in rows})
+
+
+archive = Archive()
+
+
+def is_replaying():
+    return ARCHIVE_MODE == "replay"
+
+
+def to_replay_url(replay_url, url):
+    """ This method is used to map a url onto the replay server, keeping its host as the first path segment """
+
+    parts = urlsplit(url)
+    return f"{replay_url}/{parts.netloc}{parts.path or '/'}" + (f"?{parts.query}" if parts.query else "")
+
+
+def rewrite_url(url):
+    """ This method is used to point a url at the replay server when replaying """
+
+    if not is_replaying() or url.startswith(REPLAY_URL):
+        return url
+    return to_replay_url(REPLAY_URL, url)
+
+
+def restore_url(path):
+    """ This method is used to get the original url back from a replay server path """
+
+    parts = urlsplit(path)
+    host, _, rest = parts.path.lstrip("/").partition("/")
+    return f"https://{host}/{rest}" + (f"?{parts.query}" if parts.query else "")
+
+
+def record_response(url, response):
+    """ This method is used to archive a response fetched over http """
+
+    if ARCHIVE_MODE != "record":
+        return
+    try:
+        archive.record(url, response.status_code, response.content, response.headers.get("Content-Type"),
+                       response.url)
+    except Exception as e:
+        print(f"[+ Replay +] Exception raised while recording {url}, {e}")
+
+
+def record_page(url, driver):
+    """ This method is used to archive the page currently loaded in the browser """
+
+    if ARCHIVE_MODE != "record":
+        return
+    try:
+        archive.record(url, 200, driver.page_source, "text/html; charset=utf-8", driver.current_url)
+    except Exception as e:
+        print(f"[+ Replay +] Exception raised while recording {url}, {e}")
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """ Serves archived responses with the latency, jitter and block pages of the server """
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        # the browser sends absolute urls to the server as its proxy
+        url = self.path if urlsplit(self.path).scheme else restore_url(self.path)
+        site = get_site(url)
+        if site == "walmart" and urlsplit(url).path == "/blocked":
+            return self.send_body(*BLOCK_PAGES["walmart"], "text/html; charset=utf-8")
+        if site in BLOCK_PAGES and random.random() < server.block_rate:
+            # walmart redirects to its block page while the others serve it in place
+            if site == "walmart":
+                return self.send_redirect(f"https://www.walmart.com/blocked?url={quote(url, safe='')}")
+            return self.send_body(*BLOCK_PAGES[site], "text/html; charset=utf-8")
+
+        response = server.find(url)
+        if response is None:
+            return self.send_body(404, f"Not recorded: {url}", "text/plain; charset=utf-8")
+        if response["location"]:
+            return self.send_redirect(response["location"])
+        self.send_body(response["status"], response["body"], response["content_type"] or "text/html; charset=utf-8")
+
+    def do_CONNECT(self):
+        """ This method is used to refuse the https tunnels of the browser, nothing but the archive being served """
+
+        self.close_connection = True
+        self.send_body(403, f"Not recorded: {self.path}", "text/plain; charset=utf-8")
+
+    def send_redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", to_replay_url(self.server.url, location))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_body(self, status, body, content_type):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """ Local stand-in for the scraped sites """
+
+    daemon_threads = True
+
+    def __init__(self, archive, host=REPLAY_HOST, port=REPLAY_PORT, latency=0.0, jitter=0.0, block_rate=0.0,
+                 verbose=False):
+        super().__init__((host, port), ReplayHandler)
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.block_rate = block_rate
+        self.verbose = verbose
+        self.url = f"http://{host}:{self.server_address[1]}"
+        self._hosts = archive.hosts()
+
+    def find(self, url):
+        """ This method is used to find the recorded response of a url
+
+        Relative links resolved against the replay server lose their host, so a miss is retried on every
+        recorded host.
+        """
+
+        if response := self.archive.get(url):
+            return response
+        parts = urlsplit(url)
+        if "." not in parts.netloc:
+            path = f"/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+            for host in self._hosts:
+                if response := self.archive.get(f"https://{host}{path}"):
+                    return response
+        return None
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument("--archive", default=ARCHIVE_PATH)
+    argument_parser.add_argument("--host", default=REPLAY_HOST)
+    argument_parser.add_argument("--port", type=int, default=REPLAY_PORT)
+    argument_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    argument_parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds around the latency")
+    argument_parser.add_argument("--block-rate", type=float, default=0.0, help="share of requests served a block page")
+    argument_parser.add_argument("--seed", type=int, default=None)
+    argument_parser.add_argument("--verbose", action="store_true")
+    args = argument_parser.parse_args(argv)
+
+    random.seed(args.seed)
+    server = ReplayServer(Archive(args.archive), args.host, args.port, args.latency, args.jitter, args.block_rate,
+                          args.verbose)
+    print(f"[+ Replay +] Serving {args.archive} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import json
+import threading
+from fnmatch import fnmatch
+from collections import defaultdict, deque
+from urllib.parse import quote, urlsplit
+
+from app.config import RESOURCE_POLICIES, RESOURCE_ACCOUNTING, REPLAY_HOST, REPLAY_PORT
+from app.helpers.replay import is_replaying
+
+BLOCKED_PROXY = "PROXY 127.0.0.1:9"
+
+TYPE_PREFERENCES = {
+    "image": {"permissions.default.image": 2},
+    "media": {"media.autoplay.default": 5, "media.preload.default": 0, "media.preload.auto": 0},
+    "font": {"browser.display.use_document_fonts": 0, "gfx.downloadable_fonts.enabled": False},
+}
+
+TYPE_ELEMENTS = {
+    "image": "img[src], img[srcset], picture source[srcset]",
+    "media": "video[src], video source[src], audio[src], audio source[src]",
+}
+
+RESOURCE_SCRIPT = """
+const entries = performance.getEntriesByType('resource').map(e => ({name: e.name, bytes: e.transferSize || 0}));
+const counts = {};
+for (const [type, selector] of Object.entries(arguments[0])) {
+    counts[type] = document.querySelectorAll(selector).length;
+}
+return {entries: entries, elements: counts};
+"""
+
+
+def get_resource_policy(site=None):
+    """ This method is used to get the resource policy of the site """
+
+    return RESOURCE_POLICIES.get(site) or RESOURCE_POLICIES["default"]
+
+
+def build_pac_script(policy):
+    """ This method is used to build a proxy auto-config script sending denied hosts to a dead proxy """
+
+    allow_hosts = json.dumps(policy.get("allow_hosts") or [])
+    deny_hosts = json.dumps(policy.get("deny_hosts") or [])
+    return (
+        "function FindProxyForURL(url, host) {"
+        f" var allow = {allow_hosts}; var deny = {deny_hosts};"
+        " for (var i = 0; i < allow.length; i++) { if (shExpMatch(host, allow[i])) return 'DIRECT'; }"
+        f" for (var j = 0; j < deny.length; j++) {{ if (shExpMatch(host, deny[j])) return '{BLOCKED_PROXY}'; }}"
+        " return 'DIRECT'; }"
+    )
+
+
+def build_replay_pac_script(host=REPLAY_HOST, port=REPLAY_PORT):
+    """ This method is used to build a proxy auto-config script sending every request to the replay server
+
+    Plain http requests are then served from the archive and https tunnels refused, so no subresource of a
+    replayed page reaches the live sites.
+    """
+
+    return (
+        "function FindProxyForURL(url, host) {"
+        f" if (host == '{host}') return 'DIRECT';"
+        f" return 'PROXY {host}:{port}'; }}"
+    )
+
+
+def apply_resource_policy(options, site=None):
+    """ This method is used to apply the resource policy of the site to the Firefox options """
+
+    policy = get_resource_policy(site)
+
+    for resource_type in policy.get("block_types") or []:
+        if resource_type not in TYPE_PREFERENCES:
+            raise ValueError(f"Unsupported resource type: {resource_type}")
+        for name, value in TYPE_PREFERENCES[resource_type].items():
+            options.set_preference(name, value)
+
+    pac_script = None
+    if is_replaying():
+        pac_script = build_replay_pac_script()
+    elif policy.get("deny_hosts"):
+        pac_script = build_pac_script(policy)
+    if pac_script:
+        options.set_preference("network.proxy.type", 2)
+        options.set_preference("network.proxy.autoconfig_url",
+                               "data:application/x-ns-proxy-autoconfig," + quote(pac_script))
+
+    return options
+
+
+def is_host_denied(host, policy):
+    """ This method is used to check a host against the allow and deny rules """
+
+    if any(fnmatch(host, pattern) for pattern in policy.get("allow_hosts") or []):
+        return False
+    return any(fnmatch(host, pattern) for pattern in policy.get("deny_hosts") or [])
+
+
+class ResourceStats:
+    """ Per-site accounting of the requests loaded and blocked by the resource policy """
+
+    def __init__(self, history_size=100):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(lambda: {"pages": 0, "requests_loaded": 0, "bytes_loaded": 0,
+                                            "requests_blocked": 0})
+        self._pages = deque(maxlen=history_size)
+
+    def record(self, site, url, page):
+        with self._lock:
+            totals = self._totals[site or "default"]
+            totals["pages"] += 1
+            for key in ("requests_loaded", "bytes_loaded", "requests_blocked"):
+                totals[key] += page[key]
+            self._pages.append({"site": site, "url": url, **page})
+
+    def stats(self):
+        with self._lock:
+            return {"sites": {site: dict(totals) for site, totals in self._totals.items()},
+                    "recent_pages": list(self._pages)}
+
+
+resource_stats = ResourceStats()
+
+
+def record_page_resources(driver, site, url):
+    """ This method is used to account for the requests loaded and blocked on the current page
+
+    Bytes are only known for loaded requests; requests blocked by preference are never issued, so they are
+    counted from the elements referencing them.
+    """
+
+    if not RESOURCE_ACCOUNTING:
+        return None
+
+    policy = get_resource_policy(site)
+    blocked_elements = {resource_type: selector for resource_type, selector in TYPE_ELEMENTS.items()
+                        if resource_type in (policy.get("block_types") or [])}
+    try:
+        result = driver.execute_script(RESOURCE_SCRIPT, blocked_elements) or {}
+    except Exception as e:
+        print(f"[+ ResourcePolicy +] Exception raised, {e}")
+        return None
+
+    loaded, blocked_by_host = [], 0
+    for entry in result.get("entries") or []:
+        if is_host_denied(urlsplit(entry["name"]).hostname or "", policy):
+            blocked_by_host += 1
+        else:
+            loaded.append(entry)
+
+    blocked_by_type = result.get("elements") or {}
+    page = {
+        "requests_loaded": len(loaded),
+        "bytes_loaded": sum(entry["bytes"] for entry in loaded),
+        "requests_blocked": blocked_by_host + sum(blocked_by_type.values()),
+        "blocked_by_type": blocked_by_type,
+        "blocked_by_host": blocked_by_host,
+    }
+    resource_stats.record(site, url, page)
+    return page
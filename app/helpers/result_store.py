@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from functools import wraps
+
+from app.config import RESULT_STORE_ENABLED, RESULT_STORE_PATH, RESULT_STORE_BATCH_SIZE, RESULT_STORE_FLUSH_INTERVAL
+from app.helpers.page_cache import normalize_url
+
+ASIN_PATTERN = re.compile(r"/dp/([A-Z0-9]{10})")
+EBAY_ITEM_PATTERN = re.compile(r"/itm/(?:[^/]+/)?(\d+)")
+WALMART_ITEM_PATTERN = re.compile(r"/ip/(?:[^/]+/)?(\d+)")
+
+# where each site keeps the fields stored in their own columns and tables
+SITE_FIELDS = {
+    "amazon": {"rating": "ratings", "total_ratings": "total_ratings", "specs": "product_info",
+               "variants": {"color": "color_variants", "size": "sizes"}, "text_reviews": False},
+    "ebay": {"rating": None, "total_ratings": None, "specs": "about_item",
+             "variants": {"color": "color_variants", "size": "sizes"}, "text_reviews": True},
+    "walmart": {"rating": "ratings", "total_ratings": "total_reviews", "specs": "specifications",
+                "variants": {"color": "color_variants", "size": "sizes"}, "text_reviews": False},
+}
+PRODUCT_COLUMNS = ("url", "title", "price")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS products (
+        site TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        url TEXT,
+        title TEXT,
+        price TEXT,
+        rating TEXT,
+        total_ratings TEXT,
+        scraped_at REAL NOT NULL,
+        checked_at REAL,
+        extra TEXT NOT NULL,
+        PRIMARY KEY (site, product_id)
+    );
+    CREATE INDEX IF NOT EXISTS products_scraped_at ON products (scraped_at);
+    CREATE INDEX IF NOT EXISTS products_site_scraped_at ON products (site, scraped_at);
+    CREATE TABLE IF NOT EXISTS product_keywords (
+        site TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        keyword TEXT NOT NULL,
+        scraped_at REAL NOT NULL,
+        PRIMARY KEY (site, product_id, keyword)
+    );
+    CREATE INDEX IF NOT EXISTS product_keywords_keyword ON product_keywords (keyword, scraped_at);
+    CREATE TABLE IF NOT EXISTS variants (
+        site TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        value TEXT,
+        PRIMARY KEY (site, product_id, kind, position)
+    );
+    CREATE TABLE IF NOT EXISTS specs (
+        site TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        value TEXT,
+        PRIMARY KEY (site, product_id, position)
+    );
+    CREATE TABLE IF NOT EXISTS reviews (
+        site TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        title TEXT,
+        text TEXT,
+        rating TEXT,
+        helpful_count INTEGER,
+        PRIMARY KEY (site, product_id, position)
+    );
+"""
+
+
+def normalize_keyword(keyword):
+    return " ".join((keyword or "").lower().split())
+
+
+def get_product_id(site, product):
+    """ This method is used to get the id of a product on its site: the ASIN, the eBay item id or the Walmart id """
+
+    url = product.get("url") or ""
+    if site == "ebay" and product.get("product_id"):
+        return str(product["product_id"])
+    pattern = {"amazon": ASIN_PATTERN, "ebay": EBAY_ITEM_PATTERN, "walmart": WALMART_ITEM_PATTERN}.get(site)
+    if pattern and (match := pattern.search(url)):
+        return match.group(1)
+    return normalize_url(url) if url else None
+
+
+def is_storable(product):
+    """ This method is used to check that a product is complete enough to be stored """
+
+    return bool(product and product.get("title") and not product.get("error") and not product.get("partial"))
+
+
+class ResultStore:
+    """ Scraped products stored in normalized tables, keyed by site and product id
+
+    Products are queued and written by a background thread, one transaction per batch of batch_size products or
+    every flush_interval seconds. Reads flush the queue first, so they always see every product scraped so far.
+    """
+
+    def __init__(self, path=RESULT_STORE_PATH, batch_size=RESULT_STORE_BATCH_SIZE,
+                 flush_interval=RESULT_STORE_FLUSH_INTERVAL, enabled=RESULT_STORE_ENABLED):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+
+        self._connection = None
+        self._pending = []
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+
+    def _connect(self):
+        """ This method is used to open the result database on first use, the lock being held """
+
+        if self._connection is None:
+            if directory := os.path.dirname(self.path):
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def add(self, site, product):
+        """ This method is used to queue a scraped product for writing """
+
+        if not self.enabled or not is_storable(product):
+            return
+        with self._condition:
+            if self._closed:
+                return
+            self._pending.append((site, product, time.time()))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="result-store", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def _run(self):
+        """ This method is used to write the queued products until the store closes """
+
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) >= self.batch_size or self._closed,
+                                         timeout=self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[+ ResultStore +] Exception raised while writing products, {e}")
+            if closed:
+                return
+
+    def flush(self):
+        """ This method is used to write every queued product in a single transaction """
+
+        with self._lock:
+            with self._condition:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            connection = self._connect()
+            with connection:
+                for site, product, scraped_at in pending:
+                    self._write(connection, site, product, scraped_at)
+
+    @staticmethod
+    def _write(connection, site, product, scraped_at):
+        """ This method is used to replace the rows of a product, inside the caller's transaction """
+
+        if (product_id := get_product_id(site, product)) is None:
+            return
+        fields = SITE_FIELDS.get(site, SITE_FIELDS["amazon"])
+        key = (site, product_id)
+        normalized = {*PRODUCT_COLUMNS, "reviews", "checked_at", fields["specs"], *fields["variants"].values(),
+                      *filter(None, (fields["rating"], fields["total_ratings"]))}
+        extra = {name: value for name, value in product.items() if name not in normalized}
+
+        connection.execute("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (*key, product.get("url"), product.get("title"), product.get("price"),
+                            product.get(fields["rating"]) if fields["rating"] else None,
+                            product.get(fields["total_ratings"]) if fields["total_ratings"] else None,
+                            scraped_at, product.get("checked_at"), json.dumps(extra, default=str)))
+        if keyword := normalize_keyword(product.get("SEARCH_KEYWORD")):
+            connection.execute("INSERT OR REPLACE INTO product_keywords VALUES (?, ?, ?, ?)",
+                               (*key, keyword, scraped_at))
+
+        for table in ("variants", "specs", "reviews"):
+            connection.execute(f"DELETE FROM {table} WHERE site = ? AND product_id = ?", key)
+        connection.executemany(
+            "INSERT INTO variants VALUES (?, ?, ?, ?, ?)",
+            [(*key, kind, position, str(value))
+             for kind, field in fields["variants"].items()
+             for position, value in enumerate(product.get(field) or [])])
+        connection.executemany(
+            "INSERT INTO specs VALUES (?, ?, ?, ?, ?)",
+            [(*key, position, str(name), None if value is None else str(value))
+             for position, (name, value) in enumerate((product.get(fields["specs"]) or {}).items())])
+        connection.executemany(
+            "INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(*key, position, None, review, None, None) if isinstance(review, str) else
+             (*key, position, review.get("review_title"), review.get("review_text"), review.get("rating"),
+              review.get("helpful_count"))
+             for position, review in enumerate(product.get("reviews") or [])])
+
+    def _read(self, connection, rows):
+        """ This method is used to rebuild the records of product rows, the lock being held """
+
+        records = []
+        for site, product_id, url, title, price, rating, total_ratings, scraped_at, checked_at, extra in rows:
+            fields = SITE_FIELDS.get(site, SITE_FIELDS["amazon"])
+            key = (site, product_id)
+            record = {"site": site, "product_id": product_id, **json.loads(extra), "url": url, "title": title,
+                      "price": price}
+            if fields["rating"]:
+                record[fields["rating"]] = rating
+            if fields["total_ratings"]:
+                record[fields["total_ratings"]] = total_ratings
+
+            variants = {kind: [] for kind in fields["variants"]}
+            for kind, value in connection.execute(
+                    "SELECT kind, value FROM variants WHERE site = ? AND product_id = ? ORDER BY kind, position", key):
+                variants.setdefault(kind, []).append(value)
+            for kind, field in fields["variants"].items():
+                record[field] = variants[kind]
+            record[fields["specs"]] = dict(connection.execute(
+                "SELECT name, value FROM specs WHERE site = ? AND product_id = ? ORDER BY position", key).fetchall())
+
+            reviews = []
+            for review_title, text, review_rating, helpful_count in connection.execute(
+                    "SELECT title, text, rating, helpful_count FROM reviews WHERE site = ? AND product_id = ? "
+                    "ORDER BY position", key):
+                if fields["text_reviews"]:
+                    reviews.append(text)
+                    continue
+                review = {"review_title": review_title, "review_text": text, "rating": review_rating}
+                if helpful_count is not None:
+                    review["helpful_count"] = helpful_count
+                reviews.append(review)
+            record["reviews"] = reviews
+            record["checked_at"] = checked_at
+            record["scraped_at"] = scraped_at
+            records.append(record)
+        return records
+
+    def get(self, site, product_id):
+        """ This method is used to get a stored product by site and id, None when it was never stored """
+
+        if not self.enabled:
+            return None
+        self.flush()
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute("SELECT * FROM products WHERE site = ? AND product_id = ?",
+                                      (site, product_id)).fetchall()
+            records = self._read(connection, rows)
+        return records[0] if records else None
+
+    def query(self, keyword=None, site=None, since=None, limit=50, offset=0):
+        """ This method is used to get the stored products, newest first, filtered by keyword, site and scrape time """
+
+        if not self.enabled:
+            return []
+        self.flush()
+        conditions, parameters = [], []
+        if keyword:
+            conditions.append("(p.site, p.product_id) IN "
+                              "(SELECT site, product_id FROM product_keywords WHERE keyword = ?)")
+            parameters.append(normalize_keyword(keyword))
+        if site:
+            conditions.append("p.site = ?")
+            parameters.append(site)
+        if since is not None:
+            conditions.append("p.scraped_at >= ?")
+            parameters.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute(f"SELECT p.* FROM products p {where} ORDER BY p.scraped_at DESC "
+                                      "LIMIT ? OFFSET ?", (*parameters, limit, offset)).fetchall()
+            return self._read(connection, rows)
+
+    def close(self):
+        """ This method is used to write the queued products and stop the writer """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.flush()
+
+
+result_store = ResultStore()
+
+
+def stored_product(site):
+    """ This method is used to decorate a product scrape so that its result is stored """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            product = func(*args, **kwargs)
+            result_store.add(site, product)
+            return product
+        return wrapper
+    return decorator
@@ -0,0 +1,34 @@
+import json
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def encode_record(record, stream_format):
+    """ This method is used to encode one record as an ndjson line or a server-sent event """
+
+    payload = json.dumps(record, default=str)
+    if stream_format == "sse":
+        return f"event: {record['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+def stream_products(site, products, stream_format="ndjson", budget=None):
+    """ This method is used to turn a (position, total, product) iterator into streamed records
+
+    The done record tells whether the budget of the scrape ran out before it finished.
+    """
+
+    count = 0
+    try:
+        for position, total, product in products:
+            count += 1
+            yield encode_record({"type": "product", "site": site, "position": position, "total": total,
+                                 "data": product}, stream_format)
+    except Exception as e:
+        print(f"[+ Stream +] Exception raised while streaming {site}, {e}")
+        yield encode_record({"type": "error", "site": site, "error": str(e)}, stream_format)
+    yield encode_record({"type": "done", "site": site, "count": count,
+                         "partial": bool(budget and budget.exhausted)}, stream_format)
@@ -0,0 +1,64 @@
+import time
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.wait import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from app.config import WAIT_TIMEOUT, WAIT_POLL_INTERVAL, WAIT_QUIET_PERIOD
+from app.helpers.metrics import WAIT_SECONDS
+
+INSTALL_MUTATION_OBSERVER = """
+if (!window.__scraperMutationObserver) {
+    window.__scraperLastMutation = Date.now();
+    window.__scraperMutationObserver = new MutationObserver(() => { window.__scraperLastMutation = Date.now(); });
+    window.__scraperMutationObserver.observe(document, {subtree: true, childList: true, attributes: true});
+}
+"""
+
+MILLISECONDS_SINCE_LAST_MUTATION = "return Date.now() - (window.__scraperLastMutation || 0);"
+
+
+def record_wait(name, seconds, timed_out):
+    """ This method is used to record how long a wait took """
+
+    WAIT_SECONDS.labels(name, str(bool(timed_out)).lower()).observe(seconds)
+
+
+def wait_until(driver, condition, name, timeout=WAIT_TIMEOUT, poll_interval=WAIT_POLL_INTERVAL):
+    """ This method is used to wait for a condition, returning its value or None on timeout """
+
+    started_at = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=poll_interval).until(condition)
+        record_wait(name, time.perf_counter() - started_at, False)
+        return result
+    except (TimeoutException, WebDriverException):
+        record_wait(name, time.perf_counter() - started_at, True)
+        return None
+
+
+def wait_for_element(driver, selector, name, timeout=WAIT_TIMEOUT):
+    """ This method is used to wait until an element is present """
+
+    return wait_until(driver, EC.presence_of_element_located((By.CSS_SELECTOR, selector)), name, timeout)
+
+
+def wait_for_clickable(driver, selector, name, timeout=WAIT_TIMEOUT):
+    """ This method is used to wait until an element can be clicked """
+
+    return wait_until(driver, EC.element_to_be_clickable((By.CSS_SELECTOR, selector)), name, timeout)
+
+
+def wait_for_dom_settled(driver, name, quiet_period=WAIT_QUIET_PERIOD, timeout=WAIT_TIMEOUT):
+    """ This method is used to wait until the DOM has not changed for the quiet period """
+
+    try:
+        driver.execute_script(INSTALL_MUTATION_OBSERVER)
+    except WebDriverException:
+        return None
+
+    def settled(d):
+        return d.execute_script(MILLISECONDS_SINCE_LAST_MUTATION) >= quiet_period * 1000
+
+    return wait_until(driver, settled, name, timeout)
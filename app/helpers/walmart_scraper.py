@@ -1,31 +1,29 @@
+import json
+import math
 import time
+from urllib.parse import urljoin
 import undetected_chromedriver as uc
-from bs4 import BeautifulSoup as bs
 
 from selenium_stealth import stealth
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from selenium.webdriver import Firefox
+from app.config import WALMART_SNAPSHOT_MODE, WALMART_JSON_FAST_PATH, WALMART_MAX_LISTING_PAGES, \
+    WALMART_LISTING_RETRIES
+from app.helpers.blocking import BlockedError, detect_block, get_unblocked_page
+from app.helpers.budget import NO_BUDGET
+from app.helpers.driver_pool import get_driver_pool
+from app.helpers.fingerprints import fingerprint_store, get_fingerprint
+from app.helpers.http_client import fetch, fetch_all
+from app.helpers.metrics import observe_page_fetch, timed_extractor, tracked_scrape
+from app.helpers.page_cache import page_cache
+from app.helpers.parser import get_soup
+from app.helpers.resource_policy import record_page_resources
+from app.helpers.result_store import stored_product
+from app.helpers.waits import wait_for_clickable, wait_for_dom_settled, wait_for_element
 
-
-def get_firefox_driver():
-    """ This method is used to get the Firefox driver """
-
-    options = FirefoxOptions()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--start-maximized')
-    options.add_argument('--disable-infobars')
-    options.add_argument('--disable-extensions')
-    options.add_argument('--disable-popup-blocking')
-    options.add_argument('--disable-dev-shm-usage')
-
-    driver = Firefox(options=options)
-
-    return driver
+driver_pool = get_driver_pool("walmart")
 
 
 def get_chrome_driver():
@@ -58,8 +56,14 @@ def get_chrome_driver():
 
 
 def get_rating_details(driver):
+    return get_rating_details_from_soup(get_soup(driver.page_source))
+
+
+@timed_extractor("walmart")
+def get_rating_details_from_soup(s):
+    """ This method is used to get the review count, rating and star breakdown from the parsed page """
+
     try:
-        s = bs(driver.page_source, features="lxml")
         rev = s.find('div', {'id': 'item-review-section'})
         if rev:
             total_reviews = rev.select_one('.pt1 a span.ml1.f7.dark-gray.underline').text.strip()[1:-1]
@@ -79,38 +83,71 @@ def get_rating_details(driver):
         return None, None, None
 
 
-def get_product_listings(driver, keyword, number_of_products):
-    """ This method is used to get the product lists """
+@timed_extractor("walmart")
+def get_listing_links_from_soup(soup):
+    """ This method is used to get the product links of a rendered search page """
+
+    return [urljoin("https://www.walmart.com", elem.get("href")) for elem in soup.select(".ph1 .hide-sibling-opacity")]
+
+
+def get_product_listings_from_dom(driver, keyword, number_of_products, budget=NO_BUDGET):
+    """ This method is used to get the product lists from the rendered search pages
+
+    A page failing WALMART_LISTING_RETRIES times in a row, a page without results, WALMART_MAX_LISTING_PAGES
+    pages or the end of the budget stop the search.
+    """
 
     page_num = 1
+    failures = 0
     product_urls = []
     done_searching = False
 
     keyword = "+".join(keyword.split(" "))
 
-    while not done_searching:
+    while not done_searching and page_num <= WALMART_MAX_LISTING_PAGES:
+        if budget.expired():
+            print(f"[+ Walmart +] Time budget exhausted while listing {keyword}")
+            break
         url = f"https://www.walmart.com/search?q={keyword}&page={page_num}"
-        driver.get(url)
 
         try:
-            if link_tags := WebDriverWait(driver, 10).until(
-                    EC.presence_of_all_elements_located(
-                        (By.CSS_SELECTOR, ".ph1 .hide-sibling-opacity"))):
-
-                for elem in link_tags:
+            if (page_source := page_cache.get(url, "listing")) is None:
+                started_at = time.perf_counter()
+                get_unblocked_page(driver, url, "walmart", budget)
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".ph1 .hide-sibling-opacity")))
+                observe_page_fetch("walmart", "listing", "browser", time.perf_counter() - started_at)
+                page_source = driver.page_source
+                record_page_resources(driver, "walmart", url)
+                page_cache.put(url, "listing", page_source)
+
+            if links := get_listing_links_from_soup(get_soup(page_source)):
+
+                for link in links:
                     if len(product_urls) >= number_of_products:
                         done_searching = True
                         break
                     else:
-                        link = elem.get_attribute("href")
                         product_urls.append(link)
                 page_num += 1
+                failures = 0
+            else:
+                print(f"[+ Walmart +] No results on page {page_num} for {keyword}")
+                break
+        except BlockedError as e:
+            print(f"[+ Walmart +] {e}, stopping the listing of {keyword}")
+            break
         except Exception as e:
             print(f"[+ Walmart +] Exception raised, {e}")
+            failures += 1
+            if failures >= WALMART_LISTING_RETRIES:
+                print(f"[+ Walmart +] Giving up on page {page_num} for {keyword}")
+                break
 
     return product_urls
 
 
+@timed_extractor("walmart")
 def get_images(driver):
     """ This method is used to get the images of the product """
 
@@ -122,6 +159,7 @@ def get_images(driver):
     return image_urls
 
 
+@timed_extractor("walmart")
 def get_ratings(driver):
     """ This method is used to get the ratings of the product """
     try:
@@ -131,6 +169,7 @@ def get_ratings(driver):
         return None
 
 
+@timed_extractor("walmart")
 def get_specifications(driver):
     """ This method is used to get the specifications of the product """
 
@@ -146,6 +185,7 @@ def get_specifications(driver):
     return specifications
 
 
+@timed_extractor("walmart")
 def get_highlights(driver):
     """ This method is used to get the highlights of the product """
 
@@ -171,14 +211,14 @@ def get_highlights(driver):
     return highlights
 
 
-def get_frequent_mentions(driver):
-    """ This method is used to get the frequent mentions of the product """
+def expand_frequent_mentions(driver):
+    """ This method is used to open the frequent mentions of the product """
 
     try:
         element = driver.find_element(By.CSS_SELECTOR, ".overflow-auto")
 
         driver.execute_script("arguments[0].scrollIntoView(true);", element)
-        time.sleep(2)
+        wait_for_clickable(driver, "#item-review-section button.ph0", "walmart.frequent_mentions", timeout=2)
         driver.find_element(By.CSS_SELECTOR, "#item-review-section button.ph0").click()
 
     except Exception as e:
@@ -190,6 +230,13 @@ def get_frequent_mentions(driver):
 
         pass
 
+
+@timed_extractor("walmart")
+def get_frequent_mentions(driver):
+    """ This method is used to get the frequent mentions of the product """
+
+    expand_frequent_mentions(driver)
+
     mentions = []
 
     if mentions_tag := driver.find_elements(By.CSS_SELECTOR, ".overflow-auto .pr1"):
@@ -198,6 +245,7 @@ def get_frequent_mentions(driver):
     return mentions
 
 
+@timed_extractor("walmart")
 def get_product_description(driver):
     """ This method is used to get the product description of the product """
 
@@ -206,6 +254,7 @@ def get_product_description(driver):
     return ""
 
 
+@timed_extractor("walmart")
 def get_color_variants(driver):
     """ This method is used to get the color variants of the product """
 
@@ -222,6 +271,7 @@ def get_color_variants(driver):
     return []
 
 
+@timed_extractor("walmart")
 def get_sizes(driver):
     """ This method is used to get the sizes of the product """
 
@@ -237,21 +287,30 @@ def get_sizes(driver):
     return []
 
 
-def get_reviews(driver, number_of_reviews):
-    """ This method is used to get the reviews of the product """
-
-    reviews = []
-    page_num = 1
-    reviews_fetched = False
+def expand_reviews(driver, rev):
+    """ This method is used to expand the truncated reviews shown on the product page """
 
-    rev = driver.find_element(By.CSS_SELECTOR, "#item-review-section")
     list_rev = rev.find_elements(By.CSS_SELECTOR, '.overflow-hidden.nr3.nr1-m li')
     for l_rev in list_rev:
         try:
             l_rev.find_element(By.TAG_NAME, 'button').click()
         except:
             pass
-        time.sleep(1)
+    if list_rev:
+        wait_for_dom_settled(driver, "walmart.expand_reviews", quiet_period=0.2, timeout=2)
+    return list_rev
+
+
+@timed_extractor("walmart")
+def get_reviews(driver, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to get the reviews of the product """
+
+    reviews = []
+    page_num = 1
+    reviews_fetched = False
+
+    rev = driver.find_element(By.CSS_SELECTOR, "#item-review-section")
+    list_rev = expand_reviews(driver, rev)
 
     for l in list_rev:
 
@@ -273,9 +332,13 @@ def get_reviews(driver, number_of_reviews):
     except:
         return reviews
     reviews_data = []
-    while not reviews_fetched:
+    while not reviews_fetched and not budget.expired():
         url = f"{review_link}?page={page_num}"
-        driver.get(url)
+        try:
+            get_unblocked_page(driver, url, "walmart", budget)
+        except BlockedError as e:
+            print(f"[+ Walmart +] {e}, keeping the reviews found so far")
+            break
         review_list = driver.find_elements(By.CSS_SELECTOR, "li.dib.w-100.mb3")
         if not review_list:
             break
@@ -306,25 +369,446 @@ def get_reviews(driver, number_of_reviews):
     return reviews
 
 
-def scrap_product_data(driver, product_url, keyword, number_of_reviews):
-    """ This method is used to scrap the product data """
+def get_tag_text(tag, separator=" "):
+    """ This method is used to get the visible-like text of a parsed tag """
+
+    if not tag:
+        return None
+    return separator.join(line for line in (" ".join(part.split()) for part in tag.get_text("\n").split("\n")) if line)
+
+
+@timed_extractor("walmart")
+def get_images_from_soup(soup):
+    """ This method is used to get the images of the product from the parsed page """
+
+    return [img.get('src').split(".jpeg")[0] + ".jpeg?odnHeight=2000&odnWidth=2000&odnBg=FFFFFF"
+            for img in soup.select("[data-testid='media-thumbnail'] img") if img.get('src')]
+
+
+@timed_extractor("walmart")
+def get_ratings_from_soup(soup):
+    """ This method is used to get the ratings of the product from the parsed page """
+
+    if rating_tag := soup.select_one("span.rating-number"):
+        return get_tag_text(rating_tag).replace("(", "").replace(")", "")
+    return None
+
+
+@timed_extractor("walmart")
+def get_specifications_from_soup(soup):
+    """ This method is used to get the specifications of the product from the parsed page """
+
+    specifications = {}
+    if specs_container := soup.select_one(".ph3.pb4.pt1 .nt1"):
+        for spec in specs_container.select("div")[::2]:
+            key = spec.select_one("h3")
+            value = spec.select_one(".mv0.lh-copy.f6.mid-gray")
+            if key and value:
+                specifications[get_tag_text(key)] = get_tag_text(value)
+    return specifications
+
+
+@timed_extractor("walmart")
+def get_highlights_from_soup(soup):
+    """ This method is used to get the highlights of the product from the parsed page """
+
+    highlights = {}
+    if highlights_tag := soup.select(".pv2 .flex.w-100.mv2 li"):
+        for highlight in highlights_tag:
+            data = highlight.select("div")
+            if len(data) > 1:
+                highlights[get_tag_text(data[0])] = get_tag_text(data[1])
+    else:
+        for highlight in soup.select(".pv2 .flex.w-100.mv2 div.w-50"):
+            for key, value in zip(highlight.select(".b.mv1"), highlight.select(".ml3.mv1")):
+                highlights[get_tag_text(key)] = get_tag_text(value)
+    return highlights
+
+
+@timed_extractor("walmart")
+def get_frequent_mentions_from_soup(soup):
+    """ This method is used to get the frequent mentions of the product from the parsed page """
+
+    return [get_tag_text(mention) for mention in soup.select(".overflow-auto .pr1")]
+
+
+def get_variant_group_from_soup(soup, matches):
+    """ This method is used to get the tiles of the first variant group whose label matches """
+
+    for i in range(0, 3):
+        if group := soup.select_one(f'[data-testid="variant-group-{i}"]'):
+            label = get_tag_text(group.select_one(".mid-gray.mb2")) or ""
+            if matches(label):
+                return [get_tag_text(tile) or "" for tile in
+                        group.select('button [data-testid="variant-tile"] span.w_iUH7')]
+    return None
+
+
+@timed_extractor("walmart")
+def get_color_variants_from_soup(soup):
+    """ This method is used to get the color variants of the product from the parsed page """
+
+    colors = get_variant_group_from_soup(soup, lambda label: 'Color' in label) or []
+    return [color.lstrip("selected,").strip() for color in colors if "Out of stock" not in color]
+
+
+@timed_extractor("walmart")
+def get_sizes_from_soup(soup):
+    """ This method is used to get the sizes of the product from the parsed page """
+
+    sizes = get_variant_group_from_soup(
+        soup, lambda label: any(word in label.lower() for word in ('size', 'edition', 'capacity'))) or []
+    return [size.lstrip("selected,").strip() for size in sizes]
+
+
+def get_review_from_soup(review):
+    """ This method is used to get one review from its parsed list item """
+
+    return {'review_title': get_tag_text(review.select_one("h3.w_kV33")),
+            "review_text": get_tag_text(review.select_one("span.tl-m.mb3.db-m")),
+            "rating": get_tag_text(review.select_one("span.w_iUH7"))}
+
+
+@timed_extractor("walmart")
+def get_reviews_from_snapshot(driver, soup, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to get the reviews, clicking through the driver and parsing snapshots """
+
+    reviews = []
+    rev = soup.select_one("#item-review-section")
+    if not rev:
+        return reviews
+
+    for review in rev.select('.overflow-hidden.nr3.nr1-m li'):
+        reviews.append(get_review_from_soup(review))
+        if len(reviews) >= number_of_reviews:
+            return reviews
+
+    if not (review_link := rev.select_one('[link-identifier="seeAllReviews"]')) or not review_link.get('href'):
+        return reviews
+    review_link = urljoin(driver.current_url, review_link.get('href'))
+
+    reviews_data = []
+    page_num = 1
+    while len(reviews_data) < number_of_reviews and not budget.expired():
+        try:
+            get_unblocked_page(driver, f"{review_link}?page={page_num}", "walmart", budget)
+        except BlockedError as e:
+            print(f"[+ Walmart +] {e}, keeping the reviews found so far")
+            break
+        for button in driver.find_elements(By.CSS_SELECTOR, "li.dib.w-100.mb3 button.f6.ml1"):
+            try:
+                button.click()
+            except:
+                pass
+        review_list = get_soup(driver.page_source).select("li.dib.w-100.mb3")
+        if not review_list:
+            break
+        reviews_data.extend(get_review_from_soup(review) for review in review_list)
+        page_num += 1
+
+    return reviews_data or reviews
+
+
+def scrap_product_snapshot(driver, data, product_url, keyword, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to extract the product fields from a single page source snapshot """
+
+    wait_for_element(driver, ".nb3", "walmart.description", timeout=10)
+    wait_for_element(driver, "[data-testid='media-thumbnail'] img", "walmart.images", timeout=10)
+
+    expand_frequent_mentions(driver)
+    try:
+        expand_reviews(driver, driver.find_element(By.CSS_SELECTOR, "#item-review-section"))
+    except Exception:
+        pass
+
+    soup = get_soup(driver.page_source)
+
+    data['title'] = get_tag_text(soup.select_one("#main-title"))
+    if price_tag := soup.select_one("[itemprop='price']"):
+        data['price'] = get_tag_text(price_tag).replace("Now ", "").strip()
+    data['SEARCH_KEYWORD'] = keyword
+    data['url'] = product_url
+    data['description'] = get_tag_text(soup.select_one(".nb3"), "\n") or ""
+    data['images'] = get_images_from_soup(soup)
+    data['ratings'] = get_ratings_from_soup(soup)
+    data['sizes'] = get_sizes_from_soup(soup)
+    data['color_variants'] = get_color_variants_from_soup(soup)
+    data['specifications'] = get_specifications_from_soup(soup)
+    data['quick_highlights'] = get_highlights_from_soup(soup)
+    data["frequent_mentions"] = get_frequent_mentions_from_soup(soup)
+    total_reviews, total_rating, rating_based_on_star = get_rating_details_from_soup(soup) or (None, None, None)
+    data['total_reviews'] = total_reviews
+    data['total_rating'] = total_rating
+    data['customer_reviews'] = rating_based_on_star
+    data['reviews'] = get_reviews_from_snapshot(driver, soup, number_of_reviews, budget)
+
+    return data
+
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/119.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+}
+
+PRODUCT_FIELDS = ('title', 'price', 'SEARCH_KEYWORD', 'url', 'description', 'images', 'ratings', 'sizes',
+                  'color_variants', 'specifications', 'quick_highlights', 'frequent_mentions', 'total_reviews',
+                  'total_rating', 'customer_reviews', 'reviews', 'partial', 'error')
+REQUIRED_JSON_FIELDS = ('title', 'price', 'images')
+REVIEWS_PER_PAGE = 10
+STAR_COUNT_KEYS = (("ratingValueFiveCount", "5 stars"), ("ratingValueFourCount", "4 stars"),
+                   ("ratingValueThreeCount", "3 stars"), ("ratingValueTwoCount", "2 stars"),
+                   ("ratingValueOneCount", "1 star"))
+
+
+def get_next_data(page_source):
+    """ This method is used to get the embedded __NEXT_DATA__ state of a page """
+
+    if not page_source:
+        return None
+    if script := get_soup(page_source).select_one("script#__NEXT_DATA__"):
+        try:
+            return json.loads(script.get_text())
+        except ValueError as e:
+            print(f"[+ Walmart +] Exception raised, {e}")
+    return None
+
+
+def get_next_data_over_http(url, page_type):
+    """ This method is used to fetch a page over plain http and get its embedded state """
+
+    try:
+        response = fetch(url, headers=HTTP_HEADERS, page_type=page_type)
+    except Exception as e:
+        print(f"[+ Walmart +] Exception raised, {e}")
+        return None
+    if detect_block("walmart", response) or response.status_code != 200:
+        return None
+    return get_next_data(response.content)
+
+
+def get_initial_data(next_data):
+    """ This method is used to get the initial data of the page from the embedded state """
+
+    return ((next_data or {}).get("props") or {}).get("pageProps", {}).get("initialData") or {}
+
+
+def get_listing_links_from_json(next_data):
+    """ This method is used to get the product links of a search page from its embedded state """
+
+    search_result = get_initial_data(next_data).get("searchResult") or {}
+    return [urljoin("https://www.walmart.com", item["canonicalUrl"])
+            for stack in search_result.get("itemStacks") or [] for item in stack.get("items") or []
+            if item.get("__typename") == "Product" and item.get("canonicalUrl")]
+
+
+def get_product_listings_from_json(keyword, number_of_products, budget=NO_BUDGET):
+    """ This method is used to get the product lists from the embedded search state """
+
+    keyword = "+".join(keyword.split(" "))
+    product_urls = []
+    page_num = 1
+
+    while len(product_urls) < number_of_products and page_num <= WALMART_MAX_LISTING_PAGES and not budget.expired():
+        url = f"https://www.walmart.com/search?q={keyword}&page={page_num}"
+        if not (links := get_listing_links_from_json(get_next_data_over_http(url, "listing"))):
+            break
+        for link in links:
+            if len(product_urls) >= number_of_products:
+                break
+            product_urls.append(link)
+        page_num += 1
+
+    return product_urls
+
+
+def get_text_from_html(html, separator="\n"):
+    """ This method is used to get the text of an html fragment """
+
+    if not html:
+        return ""
+    return get_soup(html).get_text(separator, strip=True)
+
+
+def get_variants_from_json(product, matches, skip_out_of_stock=False):
+    """ This method is used to get the variant names of the first criteria whose name matches """
+
+    for criteria in product.get("variantCriteria") or []:
+        if matches(criteria.get("name") or ""):
+            return [variant.get("name") for variant in criteria.get("variantList") or []
+                    if variant.get("name") and not (
+                        skip_out_of_stock and variant.get("availabilityStatus") == "OUT_OF_STOCK")]
+    return []
+
+
+def get_review_from_json(review):
+    """ This method is used to get one review from the embedded state """
+
+    rating = review.get("rating")
+    return {'review_title': review.get("reviewTitle"), "review_text": review.get("reviewText"),
+            "rating": str(rating) if rating is not None else None}
+
+
+@timed_extractor("walmart")
+def get_reviews_from_json(us_item_id, reviews_state, number_of_reviews):
+    """ This method is used to get the reviews from the embedded state, fetching more review pages over http """
+
+    reviews = [get_review_from_json(review) for review in reviews_state.get("customerReviews") or []]
+    total_reviews = reviews_state.get("totalReviewCount") or 0
+    if len(reviews) >= number_of_reviews or len(reviews) >= total_reviews or not us_item_id:
+        return reviews[:number_of_reviews]
+
+    number_of_pages = math.ceil(min(number_of_reviews, total_reviews) / REVIEWS_PER_PAGE)
+    urls = [f"https://www.walmart.com/reviews/product/{us_item_id}?page={page_num}"
+            for page_num in range(1, number_of_pages + 1)]
+
+    reviews_data = []
+    for response in fetch_all(urls, headers=HTTP_HEADERS, page_type="reviews"):
+        if response is None or detect_block("walmart", response) or response.status_code != 200:
+            return None
+        page_reviews = (get_initial_data(get_next_data(response.content)).get("data") or {}).get("reviews") or {}
+        customer_reviews = page_reviews.get("customerReviews") or []
+        reviews_data.extend(get_review_from_json(review) for review in customer_reviews)
+        if len(customer_reviews) < REVIEWS_PER_PAGE:
+            break
+    return reviews_data[:number_of_reviews]
+
+
+def get_product_fingerprint(next_data):
+    """ This method is used to fingerprint the product fields, review count and rating summary of the embedded state,
+    None when the page has no product state
+    """
+
+    state = get_initial_data(next_data).get("data") or {}
+    if not (product := state.get("product")):
+        return None
+    idml = state.get("idml") or {}
+    reviews_state = state.get("reviews") or {}
+    return get_fingerprint(
+        {key: product.get(key) for key in ("name", "shortDescription", "variantCriteria", "averageRating",
+                                           "numberOfReviews", "usItemId")},
+        (product.get("priceInfo") or {}).get("currentPrice"),
+        [image.get("url") for image in (product.get("imageInfo") or {}).get("allImages") or []],
+        {key: idml.get(key) for key in ("longDescription", "specifications", "productHighlights")},
+        {key: reviews_state.get(key) for key in ("totalReviewCount", "averageOverallRating", "topMentions",
+                                                 *(key for key, _ in STAR_COUNT_KEYS))})
+
+
+@timed_extractor("walmart")
+def get_product_data_from_json(next_data, number_of_reviews):
+    """ This method is used to get the product fields from the embedded product state """
+
+    state = get_initial_data(next_data).get("data") or {}
+    product = state.get("product")
+    if not product:
+        return {}
+    idml = state.get("idml") or {}
+    reviews_state = state.get("reviews") or {}
+
+    data = {
+        'title': product.get("name"),
+        'price': ((product.get("priceInfo") or {}).get("currentPrice") or {}).get("priceString"),
+        'description': get_text_from_html(idml.get("longDescription") or product.get("shortDescription")),
+        'images': [image["url"].split(".jpeg")[0] + ".jpeg?odnHeight=2000&odnWidth=2000&odnBg=FFFFFF"
+                   for image in (product.get("imageInfo") or {}).get("allImages") or [] if image.get("url")],
+        'sizes': get_variants_from_json(
+            product, lambda name: any(word in name.lower() for word in ('size', 'edition', 'capacity'))),
+        'color_variants': get_variants_from_json(product, lambda name: 'color' in name.lower(), True),
+        'specifications': {spec.get("name"): spec.get("value") for spec in idml.get("specifications") or []
+                           if spec.get("name")},
+        'quick_highlights': {highlight.get("name"): highlight.get("value")
+                             for highlight in idml.get("productHighlights") or [] if highlight.get("name")},
+        'frequent_mentions': [mention.get("name") for mention in reviews_state.get("topMentions") or []
+                              if mention.get("name")],
+    }
+
+    if (average_rating := product.get("averageRating")) is not None:
+        data['ratings'] = str(average_rating)
+    if (total_reviews := reviews_state.get("totalReviewCount", product.get("numberOfReviews"))) is not None:
+        data['total_reviews'] = f"{total_reviews:,}"
+    if (overall_rating := reviews_state.get("averageOverallRating")) is not None:
+        data['total_rating'] = f"{overall_rating} out of 5"
+    if star_counts := {label: f"{reviews_state[key]:,}" for key, label in STAR_COUNT_KEYS
+                       if reviews_state.get(key) is not None}:
+        data['customer_reviews'] = star_counts
+
+    reviews = get_reviews_from_json(product.get("usItemId"), reviews_state, number_of_reviews)
+    if reviews is not None:
+        data['reviews'] = reviews
+
+    return {key: value for key, value in data.items() if value not in (None, "")}
+
+
+@stored_product("walmart")
+@timed_extractor("walmart")
+def scrap_product_data(driver, product_url, keyword, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to scrap the product data, skipping the rendered page once the budget has run out
+
+    The last record is reused when the embedded state of the product did not change.
+    """
 
     print(f"[+ Walmart +] Scraping data from: {product_url}")
+
     data = {}
+    fingerprint = None
+    if WALMART_JSON_FAST_PATH:
+        next_data = get_next_data_over_http(product_url, "product")
+        fingerprint = get_product_fingerprint(next_data)
+        if product := fingerprint_store.get("walmart", product_url, fingerprint, number_of_reviews, keyword):
+            print(f"[+ Walmart +] Unchanged since the last scrape, reusing {product_url}")
+            return product
+        data = get_product_data_from_json(next_data, number_of_reviews)
+
+    if any(not data.get(field) for field in REQUIRED_JSON_FIELDS) or 'reviews' not in data:
+        if budget.expired():
+            data['partial'] = True
+            data['SEARCH_KEYWORD'] = keyword
+            data['url'] = product_url
+            return fingerprint_store.put("walmart", product_url, fingerprint, number_of_reviews,
+                                         {key: data[key] for key in PRODUCT_FIELDS if key in data})
+        print(f"[+ Walmart +] Falling back to the rendered page for {product_url}")
+        dom_data = scrap_product_data_from_dom(driver, product_url, keyword, number_of_reviews, budget)
+        for key, value in dom_data.items():
+            if key not in data or (key in REQUIRED_JSON_FIELDS and not data[key]):
+                data[key] = value
+
+    data['SEARCH_KEYWORD'] = keyword
+    data['url'] = product_url
+    return fingerprint_store.put("walmart", product_url, fingerprint, number_of_reviews,
+                                 {key: data[key] for key in PRODUCT_FIELDS if key in data})
+
+
+def scrap_product_data_from_dom(driver, product_url, keyword, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to scrap the product data from the rendered product page
+
+    Without a driver, one is borrowed from the pool for this page only.
+    """
+
+    if driver is None:
+        with driver_pool.driver() as driver:
+            return scrap_product_data_from_dom(driver, product_url, keyword, number_of_reviews, budget)
 
-    driver.get(product_url)
-    dr_link = driver.current_url
+    data = {}
 
-    while "blocked" in dr_link:
-        driver.quit()
-        driver = get_firefox_driver()
-        driver.get(product_url)
-        time.sleep(2)
-        dr_link = driver.current_url
+    started_at = time.perf_counter()
+    try:
+        get_unblocked_page(driver, product_url, "walmart", budget)
+    except BlockedError as e:
+        print(f"[+ Walmart +] {e}, giving up")
+        data['error'] = str(e)
+        return data
+    observe_page_fetch("walmart", "product", "browser", time.perf_counter() - started_at)
 
     try:
         title = WebDriverWait(driver, 10).until(EC.presence_of_element_located(
             (By.CSS_SELECTOR, "#main-title"))).text.strip()
+        record_page_resources(driver, "walmart", product_url)
+        if WALMART_SNAPSHOT_MODE:
+            data = scrap_product_snapshot(driver, data, product_url, keyword, number_of_reviews, budget)
+            if budget.exhausted and len(data['reviews']) < number_of_reviews:
+                data['partial'] = True
+            return data
+
         data['title'] = title
         price = driver.find_element(
             By.CSS_SELECTOR, "[itemprop='price']").text.replace("Now ", "").strip()
@@ -352,8 +836,10 @@ def scrap_product_data(driver, product_url, keyword, number_of_reviews):
         data['total_reviews'] = total_reviews
         data['total_rating'] = total_rating
         data['customer_reviews'] = rating_based_on_star
-        reviews = get_reviews(driver, number_of_reviews)
+        reviews = get_reviews(driver, number_of_reviews, budget)
         data['reviews'] = reviews
+        if budget.exhausted and len(reviews) < number_of_reviews:
+            data['partial'] = True
 
         return data
 
@@ -362,25 +848,63 @@ def scrap_product_data(driver, product_url, keyword, number_of_reviews):
         return data
 
 
-def scrap_walmart(keyword, number_of_products, number_of_reviews):
-    """ This is the main method of the scrapper """
+def get_product_links(keyword, number_of_products, budget=NO_BUDGET):
+    """ This method is used to get the product links of the keyword, borrowing a driver only when the json is missing """
+
+    if WALMART_JSON_FAST_PATH and (product_urls := get_product_listings_from_json(keyword, number_of_products,
+                                                                                  budget)):
+        return product_urls
+    if budget.expired():
+        return []
+    with driver_pool.driver() as driver:
+        return get_product_listings_from_dom(driver, keyword, number_of_products, budget)
 
-    print(f"[+ Walmart +] Search Keyword: {keyword}")
 
-    driver = get_firefox_driver()
+def scrap_product_with_pooled_driver(product_url, keyword, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to scrap one product, borrowing a driver only for the rendered page fallback """
+
+    if budget.expired():
+        return {"url": product_url, "partial": True}
+    try:
+        return scrap_product_data(None, product_url, keyword, number_of_reviews, budget)
+    except Exception as e:
+        print(f"[+ Walmart +] Exception raised for {product_url}, {e}")
+        return {"url": product_url, "error": str(e)}
 
-    product_links = get_product_listings(driver, keyword, number_of_products)
+
+@tracked_scrape("walmart")
+def iter_walmart(keyword, number_of_products, number_of_reviews, budget=NO_BUDGET):
+    """ This method is used to scrap walmart yielding (position, total, product) as each product finishes
+
+    No new product is started once the budget has run out. A driver is borrowed only for the pages missing from the
+    embedded json state.
+    """
+
+    print(f"[+ Walmart +] Search Keyword: {keyword}")
+
+    product_links = get_product_links(keyword, number_of_products, budget)
 
     print(f"[+ Walmart +] Product Link is found for {keyword}")
     print(f"[+ Walmart +] Links: {product_links}")
 
-    product_information = []
     if product_links:
-        for product_url in product_links:
-            result = scrap_product_data(driver, product_url, keyword, number_of_reviews)
-            product_information.append(result)
+        for position, product_url in enumerate(product_links):
+            if budget.expired():
+                print(f"[+ Walmart +] Time budget exhausted for {keyword}")
+                break
+            result = scrap_product_data(None, product_url, keyword, number_of_reviews, budget)
+            yield position, len(product_links), result
     else:
         print("[+ Walmart +] Unable to fetch product links")
 
-    driver.quit()
+
+def scrap_walmart(keyword, number_of_products, number_of_reviews, progress_callback=None, budget=NO_BUDGET):
+    """ This is the main method of the scrapper """
+
+    product_information = []
+    for position, total, result in iter_walmart(keyword, number_of_products, number_of_reviews, budget):
+        product_information.append(result)
+        if progress_callback:
+            progress_callback(len(product_information), total)
+
     return product_information
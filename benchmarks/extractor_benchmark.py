@@ -0,0 +1,349 @@
+""" Time the scrapers' extractors on a corpus of saved pages, check their output and compare against a baseline.
+
+Usage: python -m benchmarks.extractor_benchmark [corpus_dir] [--repeat N] [--sites amazon ebay walmart]
+                                               [--update-golden] [--baseline FILE] [--save-baseline FILE]
+
+The corpus holds one directory per site and page kind, e.g. amazon/product/*.html, ebay/feedback/*.html.
+Golden outputs live next to the pages under golden/<site>/<kind>/<page>.json and are written with
+--update-golden. Only extractors that work on a parsed page are timed, nothing is fetched. Extractors are
+handed the same sections the scrapers hand them.
+
+The corpus committed under benchmarks/corpus is used by default, with its baseline in benchmarks/baseline.json:
+
+    python -m benchmarks.extractor_benchmark --baseline benchmarks/baseline.json
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+from functools import partial
+
+from app.helpers import amazon_scraper, ebay_scraper, walmart_scraper
+from app.helpers.parser import BACKENDS, get_soup
+
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+
+
+def get_walmart_reviews_from_soup(soup):
+    return [walmart_scraper.get_review_from_soup(review) for review in soup.select("li.dib.w-100.mb3")]
+
+
+def scoped(extractor):
+    """ This method is used to run an extractor the way get_product_data does, on its section of the page """
+
+    return lambda arguments: amazon_scraper.get_scoped(extractor, *arguments)
+
+
+def get_amazon_product_scopes(soup):
+    """ This method is used to get the sections get_product_data hands to the extractors, by extractor name """
+
+    sections = amazon_scraper.index_sections(soup)
+    reviews_root = amazon_scraper.get_section(sections, "reviewsMedley")
+    section_scope = partial(amazon_scraper.get_section_scope, sections)
+    return {
+        "get_price": (sections, "centerCol", soup),
+        "get_sizes": (sections, "centerCol", soup),
+        "get_image_urls": section_scope("altImages"),
+        "get_product_details": section_scope("detailBullets_feature_div"),
+        "get_technical_details": (sections, "prodDetails", soup, amazon_scraper.get_section_scope),
+        "get_rate_by_feature": section_scope("cr-dp-summarization-attributes"),
+        "get_total_ratings": (sections, "reviewsMedley", soup),
+        "get_read_review_keyword": reviews_root,
+        "get_color_variant": (sections, "centerCol", soup),
+        "get_about_item": (sections, "centerCol", soup),
+        "get_size_chart": (sections, "aplus", soup),
+        "get_warranty": section_scope("productDetails_warranty_support_sections"),
+        "get_accessories": (sections, "centerCol", soup),
+        "get_product_overview": (sections, "centerCol", soup),
+        "get_customer_reviews": (sections, "reviewsMedley", soup),
+    }
+
+
+EXTRACTORS = {
+    "amazon": {
+        "search": {
+            "get_listing_asins": amazon_scraper.get_listing_asins,
+        },
+        "product": {
+            "index_sections": lambda soup: sorted(amazon_scraper.index_sections(soup)),
+            "get_price": scoped(amazon_scraper.get_price),
+            "get_sizes": scoped(amazon_scraper.get_sizes),
+            "get_image_urls": amazon_scraper.get_image_urls,
+            "get_product_details": amazon_scraper.get_product_details,
+            "get_technical_details": scoped(amazon_scraper.get_technical_details),
+            "get_rate_by_feature": amazon_scraper.get_rate_by_feature,
+            "get_total_ratings": scoped(amazon_scraper.get_total_ratings),
+            "get_read_review_keyword": lambda soup: amazon_scraper.get_read_review_keyword(None, soup),
+            "get_color_variant": scoped(amazon_scraper.get_color_variant),
+            "get_about_item": scoped(amazon_scraper.get_about_item),
+            "get_size_chart": scoped(amazon_scraper.get_size_chart),
+            "get_warranty": amazon_scraper.get_warranty,
+            "get_accessories": scoped(amazon_scraper.get_accessories),
+            "get_product_overview": scoped(amazon_scraper.get_product_overview),
+            "get_customer_reviews": scoped(amazon_scraper.get_customer_reviews),
+            "get_customer_retry_reviews": amazon_scraper.get_customer_retry_reviews,
+        },
+        "reviews": {
+            "parse_reviews": amazon_scraper.parse_reviews,
+        },
+    },
+    "ebay": {
+        "search": {
+            "get_listing_links": ebay_scraper.get_listing_links,
+        },
+        "item": {
+            "get_title": ebay_scraper.get_title,
+            "get_price": ebay_scraper.get_price,
+            "get_stock": ebay_scraper.get_stock,
+            "get_product_images": ebay_scraper.get_product_images,
+            "get_item_specification": ebay_scraper.get_item_specification,
+            "get_seller_username": ebay_scraper.get_seller_username,
+            "get_seller_rating": ebay_scraper.get_seller_rating,
+            "get_color_variants": ebay_scraper.get_color_variants,
+            "get_size_variants": ebay_scraper.get_size_variants,
+        },
+        "description": {
+            "get_item_description": lambda soup: ebay_scraper.get_item_description(None, soup),
+        },
+        "feedback": {
+            "is_feedback_page": ebay_scraper.is_feedback_page,
+        },
+    },
+    "walmart": {
+        "search": {
+            "get_listing_links_from_soup": walmart_scraper.get_listing_links_from_soup,
+        },
+        "product": {
+            "get_images_from_soup": walmart_scraper.get_images_from_soup,
+            "get_ratings_from_soup": walmart_scraper.get_ratings_from_soup,
+            "get_specifications_from_soup": walmart_scraper.get_specifications_from_soup,
+            "get_highlights_from_soup": walmart_scraper.get_highlights_from_soup,
+            "get_frequent_mentions_from_soup": walmart_scraper.get_frequent_mentions_from_soup,
+            "get_color_variants_from_soup": walmart_scraper.get_color_variants_from_soup,
+            "get_sizes_from_soup": walmart_scraper.get_sizes_from_soup,
+            "get_rating_details_from_soup": walmart_scraper.get_rating_details_from_soup,
+        },
+        "reviews": {
+            "get_reviews_from_soup": get_walmart_reviews_from_soup,
+        },
+    },
+}
+
+# Sections the scrapers hand to the extractors instead of the whole page, extractors missing here get the page.
+SCOPES = {
+    "amazon": {
+        "product": get_amazon_product_scopes,
+    },
+}
+
+# Extractors working on the embedded json state rather than the parsed page; zero reviews keeps them offline.
+SOURCE_EXTRACTORS = {
+    "walmart": {
+        "search": {
+            "get_next_data": walmart_scraper.get_next_data,
+            "get_listing_links_from_json": lambda page: walmart_scraper.get_listing_links_from_json(
+                walmart_scraper.get_next_data(page)),
+        },
+        "product": {
+            "get_product_data_from_json": lambda page: walmart_scraper.get_product_data_from_json(
+                walmart_scraper.get_next_data(page), 0),
+        },
+    },
+}
+
+
+def load_corpus(corpus_dir, sites):
+    """ This method is used to load the saved pages as {(site, kind): {name: bytes}} """
+
+    corpus = {}
+    for site in sites:
+        for kind in EXTRACTORS[site]:
+            pages = {path.stem: path.read_bytes() for path in sorted((Path(corpus_dir) / site / kind).glob("*.html"))}
+            if pages:
+                corpus[(site, kind)] = pages
+    return corpus
+
+
+def to_json(value):
+    """ This method is used to turn an extractor output into plain json values """
+
+    return json.loads(json.dumps(value, default=str))
+
+
+def run_extractor(extractor, argument):
+    """ This method is used to run an extractor once, turning its exception into an output """
+
+    try:
+        return extractor(argument)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def measure(extractor, argument, repeat):
+    """ This method is used to time an extractor and get its result and peak traced memory """
+
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        try:
+            extractor(argument)
+        except Exception:
+            pass
+        samples.append(time.perf_counter() - started_at)
+
+    tracemalloc.start()
+    output = run_extractor(extractor, argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return samples, output, peak
+
+
+def percentile(samples, fraction):
+    """ This method is used to get a percentile of the samples by nearest rank """
+
+    ordered = sorted(samples)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def summarize(samples, peaks, pages):
+    """ This method is used to summarize the timings of one extractor """
+
+    return {
+        "pages": pages,
+        "pages_per_sec": len(samples) / sum(samples) if sum(samples) else 0.0,
+        "p50_ms": percentile(samples, 0.5) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "peak_kb": max(peaks) / 1024,
+    }
+
+
+def benchmark(corpus, repeat, backend=None):
+    """ This method is used to time every extractor over its pages
+
+    Returns the per-extractor summaries and the outputs per page for the golden comparison.
+    """
+
+    results, outputs = {}, {}
+    for (site, kind), pages in corpus.items():
+        timings = {}
+        for name, page in pages.items():
+            page_outputs = outputs.setdefault((site, kind, name), {})
+
+            samples, soup, peak = measure(lambda source: get_soup(source, backend), page, repeat)
+            timings.setdefault("get_soup", ([], []))
+            timings["get_soup"][0].extend(samples)
+            timings["get_soup"][1].append(peak)
+
+            get_scopes = SCOPES.get(site, {}).get(kind)
+            scopes = get_scopes(soup) if get_scopes else {}
+            extractors = [(extractor_name, extractor, scopes.get(extractor_name, soup))
+                          for extractor_name, extractor in EXTRACTORS[site][kind].items()]
+            extractors += [(extractor_name, extractor, page)
+                           for extractor_name, extractor in SOURCE_EXTRACTORS.get(site, {}).get(kind, {}).items()]
+            for extractor_name, extractor, argument in extractors:
+                samples, output, peak = measure(extractor, argument, repeat)
+                timings.setdefault(extractor_name, ([], []))
+                timings[extractor_name][0].extend(samples)
+                timings[extractor_name][1].append(peak)
+                page_outputs[extractor_name] = to_json(output)
+
+        for extractor_name, (samples, peaks) in timings.items():
+            results[f"{site}.{kind}.{extractor_name}"] = summarize(samples, peaks, len(pages))
+    return results, outputs
+
+
+def get_golden_path(corpus_dir, site, kind, name):
+    return Path(corpus_dir) / "golden" / site / kind / f"{name}.json"
+
+
+def check_golden(corpus_dir, outputs, update=False):
+    """ This method is used to compare the outputs with the golden files, returning the differences """
+
+    differences = []
+    for (site, kind, name), page_outputs in outputs.items():
+        path = get_golden_path(corpus_dir, site, kind, name)
+        if update:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(page_outputs, indent=2, sort_keys=True, ensure_ascii=False) + "\n")
+            continue
+        if not path.exists():
+            differences.append(f"{site}/{kind}/{name}: no golden file")
+            continue
+        golden = json.loads(path.read_text())
+        for extractor_name in sorted(set(golden) | set(page_outputs)):
+            if golden.get(extractor_name) != page_outputs.get(extractor_name):
+                differences.append(f"{site}/{kind}/{name}: {extractor_name} output changed")
+    return differences
+
+
+def compare_baseline(results, baseline, threshold, min_delta_ms=0.05):
+    """ This method is used to flag the extractors whose p50 got slower than the baseline by more than the threshold """
+
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["p50_ms"], result["p50_ms"]
+        if after > before * (1 + threshold) and after - before > min_delta_ms:
+            regressions.append(f"{key}: p50 {before:.3f} ms -> {after:.3f} ms (+{(after / before - 1) * 100:.0f}%)"
+                               if before else f"{key}: p50 0 ms -> {after:.3f} ms")
+    return regressions
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument("corpus_dir", nargs="?", default=str(CORPUS_DIR))
+    argument_parser.add_argument("--repeat", type=int, default=5)
+    argument_parser.add_argument("--sites", nargs="+", default=list(EXTRACTORS), choices=list(EXTRACTORS))
+    argument_parser.add_argument("--backend", choices=BACKENDS, default=None)
+    argument_parser.add_argument("--update-golden", action="store_true")
+    argument_parser.add_argument("--baseline", help="baseline json to compare the p50 latencies against")
+    argument_parser.add_argument("--save-baseline", help="write the results as a new baseline json")
+    argument_parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown, 0.2 is 20%%")
+    argument_parser.add_argument("--min-delta-ms", type=float, default=0.05,
+                                 help="ignore p50 slowdowns smaller than this, they are timer noise")
+    args = argument_parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus_dir, args.sites)
+    if not corpus:
+        print(f"No saved pages found in {args.corpus_dir}")
+        return 1
+
+    results, outputs = benchmark(corpus, max(args.repeat, 1), args.backend)
+
+    print(f"{'extractor':<52} {'pages':>6} {'pages/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'peak KB':>9}")
+    for key, result in results.items():
+        print(f"{key:<52} {result['pages']:>6} {result['pages_per_sec']:>10.1f} {result['p50_ms']:>9.3f} "
+              f"{result['p95_ms']:>9.3f} {result['peak_kb']:>9.1f}")
+
+    failed = False
+    differences = check_golden(args.corpus_dir, outputs, args.update_golden)
+    if args.update_golden:
+        print(f"\nGolden outputs written for {len(outputs)} pages")
+    elif differences:
+        failed = True
+        print(f"\n{len(differences)} golden differences:")
+        print("\n".join(f"  {difference}" for difference in differences))
+
+    if args.baseline:
+        regressions = compare_baseline(results, json.loads(Path(args.baseline).read_text()), args.threshold,
+                                       args.min_delta_ms)
+        if regressions:
+            failed = True
+            print(f"\n{len(regressions)} regressions against {args.baseline}:")
+            print("\n".join(f"  {regression}" for regression in regressions))
+        else:
+            print(f"\nNo regressions against {args.baseline}")
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.save_baseline}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
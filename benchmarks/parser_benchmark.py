@@ -0,0 +1,76 @@
+""" Compare the parser backends on saved pages.
+
+Usage: python -m benchmarks.parser_benchmark <pages_dir> [--repeat N] [--backends lxml lexbor ...]
+"""
+import sys
+import time
+import argparse
+import resource
+import statistics
+from pathlib import Path
+from multiprocessing import get_context
+
+from app.helpers.parser import BACKENDS, get_soup
+
+
+def load_pages(pages_dir):
+    """ This method is used to load the saved html pages """
+
+    return {str(path.relative_to(pages_dir)): path.read_bytes() for path in sorted(Path(pages_dir).rglob("*.html"))}
+
+
+def measure_backend(backend, pages, repeat):
+    """ This method is used to time one backend; run in a fresh process so peak rss is per backend """
+
+    get_soup("<html></html>", backend)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings = {}
+    for name, page in pages.items():
+        samples = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            soup = get_soup(page, backend)
+            soup.select_one("#nonexistent")
+            samples.append(time.perf_counter() - started_at)
+            del soup
+        timings[name] = samples
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"timings": timings, "peak_rss_kb": max(peak_rss - baseline_rss, 0)}
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("pages_dir")
+    argument_parser.add_argument("--repeat", type=int, default=5)
+    argument_parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = argument_parser.parse_args(argv)
+
+    pages = load_pages(args.pages_dir)
+    if not pages:
+        print(f"No .html pages found in {args.pages_dir}")
+        return 1
+
+    total_mb = sum(len(page) for page in pages.values()) / 1024 / 1024
+    print(f"{len(pages)} pages, {total_mb:.2f} MB, {args.repeat} runs each\n")
+    print(f"{'backend':<12} {'mean ms/page':>14} {'median ms/page':>16} {'MB/s':>8} {'peak rss MB':>12}")
+
+    context = get_context("spawn")
+    for backend in args.backends:
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(measure_backend, (backend, pages, args.repeat))
+            except Exception as e:
+                print(f"{backend:<12} failed: {e}")
+                continue
+
+        per_page = [sample for samples in result["timings"].values() for sample in samples]
+        total_seconds = sum(per_page) / args.repeat
+        print(f"{backend:<12} {statistics.mean(per_page) * 1000:>14.2f} {statistics.median(per_page) * 1000:>16.2f} "
+              f"{total_mb / total_seconds:>8.2f} {result['peak_rss_kb'] / 1024:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,49 +1,265 @@
 import sys
+import time
+from typing import List, Optional
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 
-from app.helpers.ebay_scraper import scrap_ebay
-from app.helpers.amazon_scraper import scrap_amazon
-from app.helpers.walmart_scraper import scrap_walmart
+from app.helpers.ebay_scraper import scrap_ebay, iter_ebay, get_product_links as get_ebay_product_links, \
+    scrap_product_with_pooled_driver as scrap_ebay_product
+from app.helpers.amazon_scraper import scrap_amazon, iter_amazon, get_product_links as get_amazon_product_links, \
+    scrap_product_with_pooled_driver as scrap_amazon_product
+from app.helpers.walmart_scraper import scrap_walmart, iter_walmart, get_product_links as get_walmart_product_links, \
+    scrap_product_with_pooled_driver as scrap_walmart_product
+from app.config import REQUEST_TIME_BUDGET
+from app.helpers.batch import batch_scheduler
+from app.helpers.blocking import get_circuit_breaker_stats
+from app.helpers.budget import TimeBudget
+from app.helpers.driver_pool import driver_pools
+from app.helpers.fanout import fan_out, shutdown as shutdown_fan_out
+from app.helpers.jobs import job_manager
+from app.helpers.metrics import REQUEST_SECONDS
+from app.helpers.page_cache import page_cache
+from app.helpers.rate_limiter import rate_limiter
+from app.helpers.resource_policy import resource_stats
+from app.helpers.result_store import result_store
+from app.helpers.streaming import MEDIA_TYPES, stream_products
 
 fastapi_app = FastAPI()
 
 
+@fastapi_app.middleware("http")
+async def record_request_time(request: Request, call_next):
+    started_at = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched",
+                               str(status)).observe(time.perf_counter() - started_at)
+
+
+@fastapi_app.on_event("startup")
+def warm_up_drivers():
+    for pool in driver_pools.values():
+        pool.warm_up()
+
+
+@fastapi_app.on_event("shutdown")
+def close_drivers():
+    job_manager.shutdown()
+    batch_scheduler.shutdown()
+    shutdown_fan_out()
+    for pool in driver_pools.values():
+        pool.close()
+    result_store.close()
+
+
 class RequestBody(BaseModel):
     keyword: str
     number_of_products: int
     number_of_reviews: int
+    time_budget: Optional[float] = REQUEST_TIME_BUDGET
+
+
+class FanOutRequestBody(RequestBody):
+    sites: Optional[List[str]] = None
+    deadline: Optional[float] = None
+
+
+class BatchRequestBody(BaseModel):
+    keywords: List[str]
+    sites: Optional[List[str]] = None
+    number_of_products: int
+    number_of_reviews: int
+    # One budget covers every task of the batch, so a batch runs unbounded unless the caller sets one
+    time_budget: Optional[float] = None
+
+
+def mark_partial(response, budget):
+    """ This method is used to flag a response whose scrape ran out of time """
+
+    if budget.exhausted:
+        response.headers["X-Partial-Results"] = "true"
 
 
 @fastapi_app.post('/amazon-scraper')
-def amazon_scrapper(data: RequestBody):
+def amazon_scrapper(data: RequestBody, response: Response):
+    budget = TimeBudget(data.time_budget)
     try:
-        product_info = scrap_amazon(data.keyword, data.number_of_products, data.number_of_reviews)
+        product_info = scrap_amazon(data.keyword, data.number_of_products, data.number_of_reviews, budget=budget)
+        mark_partial(response, budget)
         return product_info
     except Exception as error:
         return {"error": error}
 
 
 @fastapi_app.post('/ebay-scraper')
-def ebay_scrapper(data: RequestBody):
+def ebay_scrapper(data: RequestBody, response: Response):
+    budget = TimeBudget(data.time_budget)
     try:
-        product_info = scrap_ebay(data.keyword, data.number_of_products, data.number_of_reviews)
+        product_info = scrap_ebay(data.keyword, data.number_of_products, data.number_of_reviews, budget=budget)
+        mark_partial(response, budget)
         return product_info
     except Exception as error:
         return {"error": error}
 
 
 @fastapi_app.post('/walmart-scraper')
-def ebay_scrapper(data: RequestBody):
+def ebay_scrapper(data: RequestBody, response: Response):
+    budget = TimeBudget(data.time_budget)
     try:
-        product_info = scrap_walmart(data.keyword, data.number_of_products, data.number_of_reviews)
+        product_info = scrap_walmart(data.keyword, data.number_of_products, data.number_of_reviews, budget=budget)
+        mark_partial(response, budget)
         return product_info
     except Exception as error:
         return {"error": error}
 
 
+SCRAPERS = {
+    "amazon": scrap_amazon,
+    "ebay": scrap_ebay,
+    "walmart": scrap_walmart,
+}
+
+STREAMERS = {
+    "amazon": iter_amazon,
+    "ebay": iter_ebay,
+    "walmart": iter_walmart,
+}
+
+PRODUCT_SCRAPERS = {
+    "amazon": (get_amazon_product_links, scrap_amazon_product),
+    "ebay": (get_ebay_product_links, scrap_ebay_product),
+    "walmart": (get_walmart_product_links, scrap_walmart_product),
+}
+
+
+@fastapi_app.post('/stream/{site}')
+def stream_scrape(site: str, data: RequestBody, format: str = "ndjson"):
+    if site not in STREAMERS:
+        raise HTTPException(status_code=404, detail=f"Unknown site: {site}")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown stream format: {format}")
+    budget = TimeBudget(data.time_budget)
+    products = STREAMERS[site](data.keyword, data.number_of_products, data.number_of_reviews, budget=budget)
+    return StreamingResponse(stream_products(site, products, format, budget), media_type=MEDIA_TYPES[format])
+
+
+@fastapi_app.post('/scrape')
+def scrape_all_sites(data: FanOutRequestBody):
+    sites = data.sites or list(STREAMERS)
+    if unknown := [site for site in sites if site not in STREAMERS]:
+        raise HTTPException(status_code=404, detail=f"Unknown site: {', '.join(unknown)}")
+    return fan_out({site: STREAMERS[site] for site in dict.fromkeys(sites)}, data.keyword, data.number_of_products,
+                   data.number_of_reviews, data.deadline, data.time_budget)
+
+
+@fastapi_app.post('/jobs/{site}')
+def create_job(site: str, data: RequestBody):
+    if site not in SCRAPERS:
+        raise HTTPException(status_code=404, detail=f"Unknown site: {site}")
+    job_id = job_manager.submit(site, SCRAPERS[site], data.keyword, data.number_of_products, data.number_of_reviews,
+                                data.time_budget)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@fastapi_app.get('/jobs/{job_id}')
+def job_status(job_id: str):
+    if job := job_manager.status(job_id):
+        return job
+    raise HTTPException(status_code=404, detail="Job not found")
+
+
+@fastapi_app.get('/jobs/{job_id}/progress')
+def job_progress(job_id: str):
+    if job := job_manager.get(job_id):
+        return {"job_id": job_id, "status": job["status"], **job["progress"]}
+    raise HTTPException(status_code=404, detail="Job not found")
+
+
+@fastapi_app.get('/jobs/{job_id}/results')
+def job_results(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        return {"job_id": job_id, "status": job["status"], "error": job["error"]}
+    if job["status"] != "finished":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job["result"]
+
+
+@fastapi_app.post('/batches')
+def create_batch(data: BatchRequestBody):
+    sites = list(dict.fromkeys(data.sites or PRODUCT_SCRAPERS))
+    if unknown := [site for site in sites if site not in PRODUCT_SCRAPERS]:
+        raise HTTPException(status_code=404, detail=f"Unknown site: {', '.join(unknown)}")
+    batch_id = batch_scheduler.submit({site: PRODUCT_SCRAPERS[site] for site in sites}, data.keywords,
+                                      data.number_of_products, data.number_of_reviews, data.time_budget)
+    return batch_scheduler.status(batch_id)
+
+
+@fastapi_app.get('/batches/{batch_id}')
+def batch_status(batch_id: str):
+    if batch := batch_scheduler.status(batch_id):
+        return batch
+    raise HTTPException(status_code=404, detail="Batch not found")
+
+
+@fastapi_app.get('/batches/{batch_id}/results')
+def batch_results(batch_id: str):
+    if (batch := batch_scheduler.status(batch_id)) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {**batch, "results": batch_scheduler.results(batch_id)}
+
+
+@fastapi_app.get('/products')
+def stored_products(keyword: Optional[str] = None, site: Optional[str] = None, since: Optional[float] = None,
+                    limit: int = 50, offset: int = 0):
+    if site and site not in SCRAPERS:
+        raise HTTPException(status_code=404, detail=f"Unknown site: {site}")
+    return result_store.query(keyword, site, since, min(max(limit, 1), 500), max(offset, 0))
+
+
+@fastapi_app.get('/products/{site}/{product_id}')
+def stored_product(site: str, product_id: str):
+    if product := result_store.get(site, product_id):
+        return product
+    raise HTTPException(status_code=404, detail="Product not found")
+
+
+@fastapi_app.get('/cache/stats')
+def cache_stats():
+    return page_cache.stats()
+
+
+@fastapi_app.get('/resources/stats')
+def resources_stats():
+    return resource_stats.stats()
+
+
+@fastapi_app.get('/rate-limits/stats')
+def get_rate_limit_stats():
+    return rate_limiter.stats()
+
+
+@fastapi_app.get('/circuit-breakers/stats')
+def circuit_breaker_stats():
+    return get_circuit_breaker_stats()
+
+
+@fastapi_app.get('/metrics')
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     try:
         uvicorn.run("run:fastapi_app", host="0.0.0.0", workers=1)
@@ -0,0 +1,30 @@
+import time
+
+from app.helpers.batch import BatchScheduler
+
+
+def get_product_links(keyword, number_of_products, budget=None):
+    return [f"{keyword}-{position}" for position in range(number_of_products)]
+
+
+def scrap_product(product_url, keyword, number_of_reviews, budget=None):
+    if product_url.endswith("-0"):
+        raise TimeoutError("Timed out waiting for a free driver")
+    return {"url": product_url, "SEARCH_KEYWORD": keyword}
+
+
+def test_driver_timeout_fails_only_its_own_task():
+    scheduler = BatchScheduler(workers=2, site_concurrency={"default": 2})
+    try:
+        batch_id = scheduler.submit({"amazon": (get_product_links, scrap_product)}, ["hat"], 3, 0)
+        deadline = time.time() + 5
+        while scheduler.status(batch_id)["status"] != "finished" and time.time() < deadline:
+            time.sleep(0.01)
+
+        batch = scheduler.status(batch_id)
+        assert batch["status"] == "finished"
+        assert batch["by_site"]["amazon"]["failed"] == 1
+        assert [error["target"] for error in batch["errors"]] == ["hat-0"]
+        assert [product["url"] for product in scheduler.results(batch_id)["amazon"]["hat"]] == ["hat-1", "hat-2"]
+    finally:
+        scheduler.shutdown()
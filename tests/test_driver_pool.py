@@ -0,0 +1,28 @@
+from app.helpers.driver_pool import DriverLimit, DriverPool
+
+
+class FakeDriver:
+    current_url = "about:blank"
+
+    def __init__(self):
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_pools_sharing_a_limit_never_exceed_it():
+    limit = DriverLimit(2)
+    amazon = DriverPool(factory=FakeDriver, min_size=1, max_size=4, site="test-amazon", limit=limit)
+    ebay = DriverPool(factory=FakeDriver, min_size=0, max_size=4, site="test-ebay", limit=limit)
+    amazon.warm_up()
+    ebay.warm_up()
+    assert limit.live == 1
+
+    first, second = amazon.acquire(), amazon.acquire()
+    amazon.release(second)
+    ebay.acquire()
+
+    assert second.driver.quit_called
+    assert limit.live == 2
+    assert amazon.stats() == {"live": 1, "idle": 0, "in_use": 1}
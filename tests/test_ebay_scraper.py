@@ -0,0 +1,23 @@
+from app.helpers import ebay_scraper
+
+LINKS = ["https://www.ebay.com/itm/1", "https://www.ebay.com/itm/2"]
+
+
+def refuse_driver():
+    raise AssertionError("no driver should be borrowed")
+
+
+def fake_scrap_product_data(driver, product_url, keyword, number_of_reviews, pages=None, budget=None):
+    return {"url": product_url, "driver": driver}
+
+
+def test_stream_and_batch_borrow_no_driver_up_front(monkeypatch):
+    monkeypatch.setattr(ebay_scraper.driver_pool, "acquire", refuse_driver)
+    monkeypatch.setattr(ebay_scraper, "get_product_links", lambda keyword, number_of_products, budget: LINKS)
+    monkeypatch.setattr(ebay_scraper, "prefetch_product_pages", lambda links: [(None, None)] * len(links))
+    monkeypatch.setattr(ebay_scraper, "scrap_product_data", fake_scrap_product_data)
+
+    streamed = [product for _, _, product in ebay_scraper.iter_ebay("hat", 2, 5)]
+    batched = [ebay_scraper.scrap_product_with_pooled_driver(link, "hat", 5) for link in LINKS]
+
+    assert streamed == batched == [{"url": link, "driver": None} for link in LINKS]
@@ -0,0 +1,26 @@
+import time
+
+from app.helpers.fanout import fan_out
+
+
+def fast_streamer(keyword, number_of_products, number_of_reviews, budget=None):
+    for position in range(number_of_products):
+        yield position, number_of_products, {"title": f"{keyword} {position}"}
+
+
+def slow_streamer(keyword, number_of_products, number_of_reviews, budget=None):
+    yield 0, number_of_products, {"title": f"{keyword} 0"}
+    time.sleep(2)
+    yield 1, number_of_products, {"title": f"{keyword} 1"}
+
+
+def test_site_slower_than_its_deadline_returns_partial_results():
+    started_at = time.time()
+    result = fan_out({"fast": fast_streamer, "slow": slow_streamer}, "hat", 2, 0, deadline=0.3)
+
+    assert time.time() - started_at < 1.5
+    assert result["sites"]["fast"]["status"] == "complete"
+    assert result["sites"]["fast"]["count"] == 2
+    assert result["sites"]["slow"]["status"] == "partial"
+    assert result["sites"]["slow"]["count"] == 1
+    assert [product["site"] for product in result["products"]] == ["fast", "fast", "slow"]
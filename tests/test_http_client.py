@@ -0,0 +1,19 @@
+import pytest
+
+from app.helpers import http_client
+from app.helpers.blocking import BlockedError, CircuitBreaker, _circuit_breakers
+
+
+def refuse_session():
+    raise AssertionError("nothing should be sent while the circuit is open")
+
+
+def test_fetch_is_paused_while_the_circuit_is_open(monkeypatch):
+    circuit_breaker = CircuitBreaker("test-site", threshold=1, backoff=60)
+    circuit_breaker.record_block()
+    monkeypatch.setitem(_circuit_breakers, "walmart", circuit_breaker)
+    monkeypatch.setattr(http_client, "get_session", refuse_session)
+
+    with pytest.raises(BlockedError):
+        http_client.fetch("https://www.walmart.com/ip/1")
+    assert http_client.fetch_all(["https://www.walmart.com/ip/1", "https://www.walmart.com/ip/2"]) == [None, None]
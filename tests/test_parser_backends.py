@@ -0,0 +1,13 @@
+import pytest
+
+from app.helpers.parser import BACKENDS
+from benchmarks.extractor_benchmark import CORPUS_DIR, EXTRACTORS, benchmark, check_golden, load_corpus
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_matches_the_golden_outputs(backend):
+    corpus = load_corpus(CORPUS_DIR, list(EXTRACTORS))
+    _, outputs = benchmark(corpus, 1, backend)
+
+    assert len(outputs) == 10
+    assert check_golden(CORPUS_DIR, outputs) == []